@@ -9,9 +9,10 @@ Author: Jose Lacunza Kobs
 Date: Noviembre 2024
 """
 
-from pydantic_settings import BaseSettings
-from typing import List, Optional
-from functools import lru_cache
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
+from typing import Annotated, FrozenSet, List, Optional
+from functools import cached_property, lru_cache
 import os
 from pathlib import Path
 
@@ -25,6 +26,8 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "UDCito API"
     VERSION: str = "1.0.0"
     DEBUG: bool = False
+    ENVIRONMENT: str = "development"
+    WORKERS: int = 4
     
     # === OpenAI y LangChain ===
     OPENAI_API_KEY: str
@@ -39,18 +42,29 @@ class Settings(BaseSettings):
     
     # === Configuración de Recuperación ===
     RETRIEVER_K: int = 10
+    MULTIQUERY_CONCURRENCY: int = 4  # Búsquedas simultáneas por consulta MultiQuery
+    MAX_DOC_CHARS: int = 2000  # Caracteres máximos por documento en el contexto
+    MAX_CONTEXT_CHARS: int = 16000  # Caracteres máximos de contexto por consulta
     
     # === Google OAuth ===
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
     
     # === Autorización ===
-    ADMIN_EMAILS: List[str] = []
-    VALIDATOR_EMAILS: List[str] = []
-    AUTHORIZED_DOMAINS: List[str] = []
+    # Se reciben como CSV en el entorno (NoDecode evita el parseo JSON)
+    ADMIN_EMAILS: Annotated[List[str], NoDecode] = []
+    VALIDATOR_EMAILS: Annotated[List[str], NoDecode] = []
+    AUTHORIZED_DOMAINS: Annotated[List[str], NoDecode] = []
     
     # === Base de Datos ===
     DB_TYPE: str = "sqlite"
+    DB_HOST: str = "localhost"
+    DB_PORT: int = 5432
+    DB_NAME: str = "udcito"
+    DB_USER: str = "udcito"
+    DB_PASSWORD: str = "udcito"
+    DB_POOL_SIZE: int = 20  # Solo PostgreSQL/MySQL
+    DB_POOL_OVERFLOW: int = 30
     SQL_ECHO: bool = False
     
     # === JWT ===
@@ -58,45 +72,51 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
     
-    @property
+    @cached_property
     def DATABASE_URL(self) -> str:
         """
-        Construye la URL de conexión a la base de datos
+        Construye la URL de conexión a la base de datos (una sola vez por instancia)
         
         Returns:
             str: URL de conexión
         """
-        if self.DB_TYPE == "sqlite":
+        db_type = self.DB_TYPE.lower()
+        if db_type == "sqlite":
             sqlite_db = Path(self.SQLITE_PATH) / "udcito.db"
             return f"sqlite:///{sqlite_db}"
         
-        # Para futuras implementaciones de PostgreSQL/MySQL
-        return f"{self.DB_TYPE}://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+        # PostgreSQL/MySQL
+        return f"{db_type}://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
     
-    @property
-    def ADMIN_EMAILS_LIST(self) -> List[str]:
-        """Lista de emails administrativos"""
-        if isinstance(self.ADMIN_EMAILS, str):
-            return [email.strip() for email in self.ADMIN_EMAILS.split(",")]
-        return self.ADMIN_EMAILS
+    @field_validator("ADMIN_EMAILS", "VALIDATOR_EMAILS", "AUTHORIZED_DOMAINS", mode="before")
+    @classmethod
+    def _split_csv(cls, value):
+        """Convierte un valor CSV ("a@x.com, b@x.com") en lista, una sola vez al construir"""
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(",") if item.strip()]
+        return value
     
-    @property
-    def VALIDATOR_EMAILS_LIST(self) -> List[str]:
-        """Lista de emails validadores"""
-        if isinstance(self.VALIDATOR_EMAILS, str):
-            return [email.strip() for email in self.VALIDATOR_EMAILS.split(",")]
-        return self.VALIDATOR_EMAILS
+    @cached_property
+    def ADMIN_EMAILS_LIST(self) -> FrozenSet[str]:
+        """Conjunto de emails administrativos (calculado una sola vez)"""
+        return frozenset(self.ADMIN_EMAILS)
     
-    @property
-    def AUTHORIZED_DOMAINS_LIST(self) -> List[str]:
-        """Lista de dominios autorizados"""
-        if isinstance(self.AUTHORIZED_DOMAINS, str):
-            return [domain.strip() for domain in self.AUTHORIZED_DOMAINS.split(",")]
-        return self.AUTHORIZED_DOMAINS
+    @cached_property
+    def VALIDATOR_EMAILS_LIST(self) -> FrozenSet[str]:
+        """Conjunto de emails validadores (calculado una sola vez)"""
+        return frozenset(self.VALIDATOR_EMAILS)
     
-    class Config:
-        env_file = ".env"
-        case_sensitive = True
+    @cached_property
+    def AUTHORIZED_DOMAINS_LIST(self) -> FrozenSet[str]:
+        """Conjunto de dominios autorizados (calculado una sola vez)"""
+        return frozenset(self.AUTHORIZED_DOMAINS)
+    
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        case_sensitive=True,
+        frozen=True,  # Inmutable: es un singleton compartido (ver get_settings)
+        ignored_types=(cached_property,)
+    )
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -3,7 +3,7 @@ Core.py - Módulo Principal del Asistente UDCito
 ==============================================
 
 Este módulo implementa la funcionalidad central del asistente virtual de la Universidad del Chubut.
-Maneja la carga de configuración, la conexión con OpenAI y la lógica de consultas.
+Maneja la conexión con OpenAI y la lógica de consultas.
 
 Mejoras implementadas:
 ✅ Uso del historial en la consulta de recuperación.
@@ -18,77 +18,83 @@ Autor: Jose Lacunza Kobs
 Fecha: Enero 2025
 """
 
-import os
+import asyncio
+import json
 import logging
-from pathlib import Path
-from dotenv import load_dotenv
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, NamedTuple
+import httpx
+from async_lru import alru_cache
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.schema import HumanMessage, AIMessage, SystemMessage
+from langchain.schema import Document, HumanMessage, AIMessage, SystemMessage
 from langchain.retrievers.multi_query import MultiQueryRetriever
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun
 
-# =====================================
-# Configuración inicial de logging
-# =====================================
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from app.config import get_settings
+from app.monitoring.metrics import metrics_collector
+
+# El logging se configura una única vez en app.config
 logger = logging.getLogger(__name__)
 
-# Limpiar cualquier API key existente para evitar conflictos
-if 'OPENAI_API_KEY' in os.environ:
-    del os.environ['OPENAI_API_KEY']
+# Caracteres de cada documento enviados al LLM para el reordenamiento
+RERANK_SNIPPET_CHARS = 500
+
+# Instrucciones fijas del asistente. Se construyen una sola vez y van
+# primero en cada consulta, de modo que el prefijo del prompt sea idéntico
+# entre requests y OpenAI pueda aplicar prompt caching.
+SYSTEM_PREAMBLE = SystemMessage(
+    content=(
+        "Eres un Chatbot asistente de la Universidad del Chubut. "
+        "Responde usando solo la información del siguiente contexto, teniendo en cuenta tambien el historial de conversacion. "
+        "Usa un tono formal y profesional. "
+        "No inventes información y responde solo con datos verificados. "
+        "Si la información no es suficiente, indícalo."
+    )
+)
+
+# Segundos durante los que se reutiliza una verificación exitosa con OpenAI
+OPENAI_CHECK_TTL = 30
+_ultima_verificacion_ok = 0.0
+
+# Tipo de mensaje de LangChain correspondiente a cada rol del historial
+_ROLE_TO_MSG = {
+    'user': HumanMessage,
+    'assistant': AIMessage,
+    'system': SystemMessage,
+}
+
+# Tamaño de las cachés LRU de reformulación y MultiQuery
+QUERY_CACHE_SIZE = 1024
 
-def load_environment():
+# Segundos que se reutilizan los resultados de recuperación (reformulación,
+# MultiQuery y `recuperar_documentos`): todas las capas expiran a la vez
+RETRIEVAL_CACHE_TTL = 600
+
+@lru_cache(maxsize=1)
+def get_http_async_client() -> httpx.AsyncClient:
     """
-    Carga y valida las variables de entorno desde el archivo .env
-    
-    El archivo .env debe contener:
-    - OPENAI_API_KEY: Clave de API de OpenAI
-    - EMBEDDING_MODEL_NAME: Nombre del modelo de embeddings
-    - MODEL_NAME: Modelo de GPT a utilizar
-    - TEMPERATURE: Temperatura para generación de respuestas
-    - MAX_TOKENS: Límite de tokens en respuestas
-    - RETRIEVER_K: Número de documentos a recuperar
-    - DATA_PATH: Ruta a los datos
-    - CHROMA_PATH: Ruta a la base de datos Chroma
+    Cliente HTTP asíncrono compartido por los clientes de OpenAI.
     
-    Returns:
-        dict: Diccionario con todas las variables de configuración
+    Mantiene conexiones keep-alive (y sesiones TLS) entre requests, con un
+    límite explícito de conexiones simultáneas.
     """
-    # Buscar el archivo .env en la carpeta actual
-    env_path = Path('.env')
-    
-    # Verificar que existe el archivo
-    if not env_path.exists():
-        raise ValueError("❌ Archivo .env no encontrado en la ruta actual")
-    
-    # Cargar variables de entorno
-    load_dotenv(env_path)
-    logger.info(f"📂 Archivo .env cargado desde: {env_path.absolute()}")
-    
-    # Validar API key
-    api_key = os.getenv('OPENAI_API_KEY')
-    if not api_key:
-        raise ValueError("❌ OPENAI_API_KEY no configurada en .env")
-    if not api_key.startswith('sk-'):
-        raise ValueError("❌ OPENAI_API_KEY con formato incorrecto")
-    
-    logger.info("✅ Variables de entorno cargadas correctamente")
-    
-    # Retornar configuración completa
-    return {
-        'OPENAI_API_KEY': api_key,
-        'EMBEDDING_MODEL_NAME': os.getenv('EMBEDDING_MODEL_NAME', 'text-embedding-3-small'),
-        'DATA_PATH': os.getenv('DATA_PATH'),
-        'CHROMA_PATH': os.getenv('CHROMA_PATH'),
-        'MODEL_NAME': os.getenv('MODEL_NAME', 'gpt-4-turbo-preview'),  # Corregido el modelo por defecto
-        'TEMPERATURE': float(os.getenv('TEMPERATURE', '0.7')),
-        'MAX_TOKENS': int(os.getenv('MAX_TOKENS', '5000')),
-        'RETRIEVER_K': int(os.getenv('RETRIEVER_K', '10'))
-    }
-
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(120.0, connect=10.0),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    )
+
+async def close_services():
+    """Cierra el cliente HTTP compartido; se llama al apagar la aplicación"""
+    if get_http_async_client.cache_info().currsize:
+        await get_http_async_client().aclose()
+    get_http_async_client.cache_clear()
+    initialize_services.cache_clear()
+    get_multiquery_retriever.cache_clear()
+
+@lru_cache(maxsize=1)
 def initialize_services():
     """
     Inicializa todos los servicios necesarios para el funcionamiento del asistente:
@@ -97,95 +103,176 @@ def initialize_services():
     3. Recuperador de documentos
     4. Modelo de lenguaje (LLM)
     
+    Se ejecuta de forma diferida en el primer uso (no al importar el módulo)
+    y el resultado queda cacheado para el resto del proceso.
+    
     Returns:
         tuple: (embeddings, db, retriever, llm)
     """
     try:
-        # Cargar configuración
-        config = load_environment()
+        # Configuración validada y cacheada (ver app.config.get_settings)
+        config = get_settings()
         
-        # Establecer API key en variables de entorno
-        os.environ['OPENAI_API_KEY'] = config['OPENAI_API_KEY']
+        # Validar API key
+        if not config.OPENAI_API_KEY.startswith('sk-'):
+            raise ValueError("❌ OPENAI_API_KEY con formato incorrecto")
         
-        # 1. Inicializar servicio de embeddings
-        embeddings = OpenAIEmbeddings(
-            openai_api_key=config['OPENAI_API_KEY']
-        )
-        
-        # 2. Validar y configurar base de datos Chroma
-        if not config['CHROMA_PATH']:
+        if not config.CHROMA_PATH:
             raise ValueError("❌ CHROMA_PATH no configurado en .env")
         
-        db = Chroma(
-            persist_directory=config['CHROMA_PATH'],
-            embedding_function=embeddings
-        )
+        # Los pasos 1, 2 y 4 son independientes entre sí (salvo que Chroma
+        # necesita los embeddings), así que se construyen en paralelo
+        # Ambos clientes de OpenAI comparten un único pool de conexiones HTTP
+        http_client = get_http_async_client()
+        
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            # 1. Inicializar servicio de embeddings
+            f_embeddings = executor.submit(
+                OpenAIEmbeddings,
+                openai_api_key=config.OPENAI_API_KEY,
+                http_async_client=http_client
+            )
+            
+            # 4. Inicializar modelo de lenguaje
+            f_llm = executor.submit(
+                ChatOpenAI,
+                model_name=config.MODEL_NAME,
+                temperature=config.TEMPERATURE,
+                max_tokens=config.MAX_TOKENS,
+                openai_api_key=config.OPENAI_API_KEY,
+                http_async_client=http_client
+            )
+            
+            # 2. Configurar base de datos Chroma (requiere los embeddings)
+            embeddings = f_embeddings.result()
+            f_db = executor.submit(
+                Chroma,
+                persist_directory=config.CHROMA_PATH,
+                embedding_function=embeddings
+            )
+            
+            db = f_db.result()
+            llm = f_llm.result()
         
         # 3. Configurar recuperador de documentos
         retriever = db.as_retriever(
             search_type="similarity",
-            search_kwargs={"k": config['RETRIEVER_K']}
-        )
-        
-        # 4. Inicializar modelo de lenguaje
-        llm = ChatOpenAI(
-            model_name=config['MODEL_NAME'],
-            temperature=config['TEMPERATURE'],
-            max_tokens=config['MAX_TOKENS'],
-            openai_api_key=config['OPENAI_API_KEY']
+            search_kwargs={"k": config.RETRIEVER_K}
         )
         
         logger.info("✅ Servicios inicializados correctamente")
         return embeddings, db, retriever, llm
         
     except Exception as e:
-        logger.error(f"❌ Error en inicialización: {str(e)}")
+        logger.error("❌ Error en inicialización: %s", e)
         raise
 
 # =====================================
-# Inicialización Global de Servicios
+# Acceso diferido a los servicios
 # =====================================
-try:
-    embeddings, db, retriever, llm = initialize_services()
-except Exception as e:
-    logger.error(f"❌ Error crítico durante la inicialización: {str(e)}")
-    raise
-
-def test_openai_connection():
+def get_embeddings() -> OpenAIEmbeddings:
+    """Retorna el servicio de embeddings, inicializándolo en el primer uso"""
+    return initialize_services()[0]
+
+def get_db() -> Chroma:
+    """Retorna la base de datos Chroma, inicializándola en el primer uso"""
+    return initialize_services()[1]
+
+def get_retriever():
+    """Retorna el recuperador de documentos, inicializándolo en el primer uso"""
+    return initialize_services()[2]
+
+def get_llm() -> ChatOpenAI:
+    """Retorna el modelo de lenguaje, inicializándolo en el primer uso"""
+    return initialize_services()[3]
+
+@lru_cache(maxsize=1)
+def get_multiquery_retriever() -> MultiQueryRetriever:
+    """Retorna el retriever MultiQuery, construyéndolo una sola vez en el primer uso"""
+    # ✅ Configuramos el retriever MultiQuery con el modelo de lenguaje
+    return MultiQueryRetriever.from_llm(
+        retriever=get_retriever(),  # 🔍 Base de datos vectorial
+        llm=get_llm(),  # 🧠 Modelo de lenguaje para generar consultas múltiples
+        include_original=True  # ✅ Incluir la consulta original en la búsqueda
+    )
+
+async def test_openai_connection() -> bool:
     """
-    Verifica la conexión con OpenAI realizando una prueba de embeddings
+    Verifica la conexión con OpenAI realizando una prueba de embeddings.
+    
+    Una verificación exitosa se reutiliza durante OPENAI_CHECK_TTL segundos
+    para que los probes frecuentes no paguen un round-trip cada vez.
     
     Returns:
         bool: True si la conexión es exitosa, False en caso contrario
     """
+    global _ultima_verificacion_ok
+    if time.monotonic() - _ultima_verificacion_ok < OPENAI_CHECK_TTL:
+        return True
     try:
-        _ = embeddings.embed_query("test")
+        _ = await get_embeddings().aembed_query("test")
+        _ultima_verificacion_ok = time.monotonic()
         logger.info("✅ Conexión con OpenAI verificada")
         return True
     except Exception as e:
-        logger.error(f"❌ Error de conexión con OpenAI: {str(e)}")
+        logger.error("❌ Error de conexión con OpenAI: %s", e)
         return False
 
-def recuperar_documentos(query: str) -> list:
+def _fragmentos_contexto(context_docs: list) -> list:
+    """
+    Recorta los documentos de contexto para acotar los tokens por consulta.
+    
+    Cada documento se trunca a MAX_DOC_CHARS y se dejan de agregar
+    documentos al superar MAX_CONTEXT_CHARS en total. Los fragmentos
+    repetidos se descartan.
+    """
+    config = get_settings()
+    fragmentos = []
+    vistos = set()
+    total = 0
+    for doc in context_docs:
+        fragmento = doc.page_content[:config.MAX_DOC_CHARS]
+        # Un repetido se saltea antes de mirar el presupuesto: no debe cortar
+        # la lista y dejar afuera documentos únicos posteriores
+        if fragmento in vistos:
+            continue
+        if total + len(fragmento) > config.MAX_CONTEXT_CHARS:
+            break
+        vistos.add(fragmento)
+        fragmentos.append(fragmento)
+        total += len(fragmento)
+    return fragmentos
+
+def _construir_mensajes(context_docs: list, question: str, history: list) -> list:
     """
-    Recupera documentos relevantes de la base de datos según la consulta
+    Arma la lista de mensajes para el LLM: preámbulo, contexto, historial y pregunta
     
     Args:
-        query (str): Consulta del usuario
+        context_docs (list): Lista de documentos de contexto
+        question (str): Pregunta del usuario
+        history (list): Historial de conversación (objetos con `role` y `content`)
         
     Returns:
-        list: Lista de documentos relevantes
+        list: Mensajes de LangChain listos para enviar al modelo
     """
-    try:
-        docs = retriever.invoke(input=query)
-        for doc in docs:
-            logger.info(f"📄 Documento recuperado: {doc.metadata}")
-        return docs
-    except Exception as e:
-        logger.error(f"❌ Error en recuperación: {str(e)}")
-        return []
-
-def consultar_llm(context_docs: list, question: str, history: list) -> str:
+    # Mensaje de contexto: cada documento va como un bloque de texto
+    # propio (sin concatenarlos), después del preámbulo fijo
+    context_message = SystemMessage(
+        content=[{"type": "text", "text": "Contexto:"}]
+        + [{"type": "text", "text": fragmento} for fragmento in _fragmentos_contexto(context_docs)]
+    )
+
+    return (
+        [SYSTEM_PREAMBLE, context_message]
+        + [
+            _ROLE_TO_MSG[msg.role](content=msg.content)
+            for msg in history
+            if msg.role in _ROLE_TO_MSG
+        ]
+        + [HumanMessage(content=question)]
+    )
+
+async def consultar_llm(context_docs: list, question: str, history: list) -> str:
     """
     Realiza una consulta al modelo de lenguaje usando el contexto y el historial
     
@@ -198,90 +285,152 @@ def consultar_llm(context_docs: list, question: str, history: list) -> str:
         str: Respuesta del modelo
     """
     try:
-        # Unir todo el contexto en un solo texto
-        context = "\n".join([doc.page_content for doc in context_docs])
-        
-        # Crear mensaje del sistema con instrucciones
-        system_message = SystemMessage(
-            content=(
-                "Eres un Chatbot asistente de la Universidad del Chubut. "
-                "Responde usando solo la información del siguiente contexto, teniendo en cuenta tambien el historial de conversacion. "
-                "Usa un tono formal y profesional. "
-                "No inventes información y responde solo con datos verificados. "
-                "Si la información no es suficiente, indícalo. "
-                f"Contexto: {context}"
-            )
-        )
-
-        # Construir lista de mensajes con el historial
-        messages = [system_message]
-        for msg in history:
-            if msg['role'] == 'user':
-                messages.append(HumanMessage(content=msg['content']))
-            elif msg['role'] == 'assistant':
-                messages.append(AIMessage(content=msg['content']))
-
-        # Agregar la pregunta actual
-        messages.append(HumanMessage(content=question))
+        messages = _construir_mensajes(context_docs, question, history)
         
         # Obtener respuesta del modelo
         logger.info("💭 Enviando consulta al LLM...")
-        response = llm.invoke(input=messages)
+        response = await get_llm().ainvoke(input=messages)
         logger.info("✅ Respuesta recibida")
         
         return response.content
 
     except Exception as e:
-        logger.error(f"❌ Error en consulta: {str(e)}")
+        logger.error("❌ Error en consulta: %s", e)
         return f"Lo siento, ocurrió un error: {str(e)}"
 
-# =====================================
-# Verificación inicial de conexión
-# =====================================
-if not test_openai_connection():
-    raise ConnectionError("❌ No se pudo establecer conexión con OpenAI")
-
-
+async def consultar_llm_stream(context_docs: list, question: str, history: list) -> AsyncIterator[str]:
+    """
+    Igual que `consultar_llm`, pero entrega la respuesta a medida que el
+    modelo la genera, fragmento por fragmento
+    
+    Args:
+        context_docs (list): Lista de documentos de contexto
+        question (str): Pregunta del usuario
+        history (list): Historial de conversación
+        
+    Yields:
+        str: Fragmentos de la respuesta del modelo
+    """
+    try:
+        messages = _construir_mensajes(context_docs, question, history)
+        
+        logger.info("💭 Enviando consulta al LLM (streaming)...")
+        async for chunk in get_llm().astream(input=messages):
+            if chunk.content:
+                yield chunk.content
+        logger.info("✅ Respuesta recibida")
 
+    except Exception as e:
+        logger.error("❌ Error en consulta: %s", e)
+        yield f"Lo siento, ocurrió un error: {str(e)}"
 
 # ==========================================
 # FUNCIONES AUXILIARES PARA MEJORAS
 # ==========================================
 
-def reformular_pregunta(history: list, question: str) -> str:
+def _normalizar_consulta(texto: str) -> str:
+    """Normaliza mayúsculas y espacios de una consulta para usarla como clave de caché"""
+    return " ".join(texto.lower().split())
+
+class _Consulta:
+    """
+    Consulta tal como la escribió el usuario, usada como argumento de las
+    cachés: se compara y se hashea por su forma normalizada, pero al LLM y
+    al embedder se les pasa `texto` sin modificar (siglas, nombres propios
+    y códigos de materias conservan sus mayúsculas).
+    """
+    __slots__ = ("texto", "clave")
+
+    def __init__(self, texto: str):
+        self.texto = texto
+        self.clave = _normalizar_consulta(texto)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, _Consulta) and self.clave == other.clave
+
+    def __hash__(self) -> int:
+        return hash(self.clave)
+
+def _deduplicar(documentos: list) -> list:
+    """
+    Elimina documentos con `page_content` repetido conservando el orden.
+
+    El conjunto de vistos guarda el texto (ya referenciado por cada
+    documento, no se copia): una colisión de hash no descarta un documento.
+    """
+    vistos = set()
+    unicos = []
+    for doc in documentos:
+        if doc.page_content not in vistos:
+            vistos.add(doc.page_content)
+            unicos.append(doc)
+    return unicos
+
+class _Mensaje(NamedTuple):
+    """Mensaje del historial inmutable y hashable (usable como clave de caché)"""
+    role: str
+    content: str
+
+def _clave_historial(history: list) -> tuple:
+    """Convierte los últimos 3 mensajes del historial en una clave hashable"""
+    return tuple(_Mensaje(msg.role, msg.content) for msg in history[-3:])
+
+@alru_cache(maxsize=QUERY_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+async def _reformular_cached(history_key: tuple, consulta: _Consulta) -> str:
+    """Reformulación memoizada por (últimos mensajes del historial, pregunta normalizada)"""
+    reformulacion = await get_llm().ainvoke(input=[
+        SystemMessage(content="Reformula la pregunta del humano teniendo en cuenta el contexto y el historial, tu respuesta se utilizara para recuperar informacion de la base vectorial y contestar la pregunta del humano."),
+        HumanMessage(content=f"Historial: {list(history_key)}"),
+        HumanMessage(content=f"Pregunta: {consulta.texto}")
+    ])
+    return reformulacion.content
+
+async def reformular_pregunta(history: list, question: str) -> str:
     """Reformula la pregunta para hacerla más clara y con contexto."""
     try:
-        reformulacion = llm.invoke(input=[
-            SystemMessage(content="Reformula la pregunta del humano teniendo en cuenta el contexto y el historial, tu respuesta se utilizara para recuperar informacion de la base vectorial y contestar la pregunta del humano."),
-            HumanMessage(content=f"Historial: {history[-3:]}"),
-            HumanMessage(content=f"Pregunta: {question}")
-        ])
+        reformulacion = await _reformular_cached(_clave_historial(history), _Consulta(question))
         logger.info("✅ Reformulación recibida")
-        logger.info(f"🔄 Reformulación: {reformulacion.content}")
+        logger.debug("🔄 Reformulación: %s", reformulacion)
 
-        return reformulacion.content
+        return reformulacion
     except Exception as e:
-        logger.error(f"❌ Error en reformulación: {str(e)}")
+        logger.error("❌ Error en reformulación: %s", e)
         return question  # Devuelve la original si falla
 
-def reordenar_documentos(query: str, documentos: list) -> list:
-    """Reordena los documentos recuperados según su relevancia."""
+async def reordenar_documentos(query: str, documentos: list) -> list:
+    """
+    Reordena los documentos recuperados según su relevancia.
+
+    Todos los documentos se evalúan en una única llamada al LLM, que devuelve
+    un puntaje por documento; luego se ordena localmente por esos puntajes.
+    """
+    if not documentos:
+        return documentos
     try:
-        documentos_rankeados = sorted(
-            documentos,
-            key=lambda doc: llm.invoke(input=[
-                SystemMessage(content="Evalúa la relevancia del documento."),
-                HumanMessage(content=f"Consulta: {query}"),
-                HumanMessage(content=f"Documento: {doc.page_content}")
-            ]).content,
-            reverse=True
+        listado = "\n\n".join(
+            f"[{i}] {doc.page_content[:RERANK_SNIPPET_CHARS]}"
+            for i, doc in enumerate(documentos)
         )
-        return documentos_rankeados
+        respuesta = await get_llm().ainvoke(input=[
+            SystemMessage(content=(
+                "Devuelve un JSON array de floats con la relevancia [0,1] de cada documento "
+                "respecto a la consulta, en el mismo orden en que se listan. "
+                "Responde solo con el array."
+            )),
+            HumanMessage(content=f"Consulta: {query}"),
+            HumanMessage(content=f"Documentos:\n{listado}")
+        ])
+        puntajes = json.loads(respuesta.content)
+        if len(puntajes) != len(documentos):
+            raise ValueError(f"se esperaban {len(documentos)} puntajes, se recibieron {len(puntajes)}")
+
+        orden = sorted(range(len(documentos)), key=lambda i: float(puntajes[i]), reverse=True)
+        return [documentos[i] for i in orden]
     except Exception as e:
-        logger.error(f"❌ Error en reordenamiento: {str(e)}")
+        logger.error("❌ Error en reordenamiento: %s", e)
         return documentos  # Devuelve los documentos en su orden original
 
-def recuperar_documentos_hibrido(query: str, history: list) -> list:
+async def recuperar_documentos_hibrido(query: str, history: list) -> list:
     """Usa búsqueda híbrida (Embeddings + Texto completo) para mejorar la recuperación."""
     try:
         # ✅ Convertir `history` en una lista de strings
@@ -290,18 +439,16 @@ def recuperar_documentos_hibrido(query: str, history: list) -> list:
         # ✅ Enriquecer la consulta con historial (si hay)
         consulta_enriquecida = f"{historial_completo} {query}".strip()
 
-        # Recuperación semántica (Embeddings)
-        documentos_semanticos = retriever.invoke(input=consulta_enriquecida)
-
-        # Recuperación por palabras clave (Texto completo)
-        documentos_texto = db.similarity_search(consulta_enriquecida, k=5)
-
-        # ✅ Solución: Usar un diccionario para eliminar duplicados
-        documentos_unicos = {doc.page_content: doc for doc in documentos_semanticos + documentos_texto}.values()
+        # Recuperación semántica (Embeddings) y por palabras clave (Texto completo), en paralelo
+        documentos_semanticos, documentos_texto = await asyncio.gather(
+            get_retriever().ainvoke(input=consulta_enriquecida),
+            get_db().asimilarity_search(consulta_enriquecida, k=5)
+        )
 
-        return list(documentos_unicos)
+        # ✅ Eliminar duplicados conservando el orden
+        return _deduplicar(documentos_semanticos + documentos_texto)
     except Exception as e:
-        logger.error(f"❌ Error en recuperación híbrida: {str(e)}")
+        logger.error("❌ Error en recuperación híbrida: %s", e)
         return []
 
 
@@ -309,34 +456,76 @@ def recuperar_documentos_hibrido(query: str, history: list) -> list:
 # FUNCIÓN PRINCIPAL DE RECUPERACIÓN DE DOCUMENTOS
 # ==========================================
 
-def recuperar_documentos(query: str, history: list) -> list:
+async def recuperar_documentos(query: str, history: list = None) -> list:
     """
     Recupera documentos relevantes basándose en la consulta y el historial.
     
-    Incorpora mejoras opcionales que pueden comentarse según necesidad.
+    Los resultados se cachean RETRIEVAL_CACHE_TTL segundos por
+    (últimos mensajes del historial, consulta normalizada), así que las
+    preguntas repetidas no vuelven a pasar por el pipeline completo.
+    
+    Args:
+        query (str): Consulta del usuario
+        history (list, opcional): Historial de conversación
+        
+    Returns:
+        list: Lista de documentos relevantes
     """
+    metrics_collector.record_cache_lookup()
     try:
-        # 1️⃣ Reformulación de la pregunta (Opcional)
-        query = reformular_pregunta(history, query)  # 💬 Comentar para desactivar
+        documentos_cache = await _recuperar_documentos_cached(
+            _clave_historial(history or []),
+            _Consulta(query)
+        )
+    except _SinDocumentos:
+        return []
+    except Exception as e:
+        logger.error("❌ Error en recuperación de documentos: %s", e)
+        return []
 
-        # 2️⃣ Recuperación de documentos con búsqueda híbrida (Opcional)
+    documentos = [
+        Document(page_content=contenido, metadata=dict(metadata))
+        for contenido, metadata in documentos_cache
+    ]
+    logger.info("📄 %d documentos recuperados", len(documentos))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📄 Metadatos: %s", [doc.metadata for doc in documentos])
+    return documentos
 
-        documentos = recuperar_documentos_multiquery(query, history)  # 🔍 Comentar para usar embbedings
-        #documentos = recuperar_documentos_hibrido(query, history)  # 🔍 Comentar para usar solo embeddings
+class _SinDocumentos(Exception):
+    """La recuperación no encontró documentos (el resultado vacío no se cachea)"""
 
-        # 3️⃣ Reordenamiento de documentos (Opcional)
-       # documentos = reordenar_documentos(query, documentos)  # 📄 Comentar si no quieres usar reranking
+@alru_cache(maxsize=QUERY_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+async def _recuperar_documentos_cached(history: tuple, consulta: _Consulta) -> tuple:
+    """
+    Pipeline de recuperación memoizado.
+    
+    La clave usa la consulta normalizada; el pipeline recibe el texto original.
+    Incorpora mejoras opcionales que pueden comentarse según necesidad.
+    """
+    metrics_collector.record_cache_miss()
+    query = consulta.texto
 
-        return documentos
-    except Exception as e:
-        logger.error(f"❌ Error en recuperación de documentos: {str(e)}")
-        return []
+    # 1️⃣ Reformulación de la pregunta (Opcional)
+    query = await reformular_pregunta(history, query)  # 💬 Comentar para desactivar
+
+    # 2️⃣ Recuperación de documentos con búsqueda híbrida (Opcional)
+
+    documentos = await recuperar_documentos_multiquery(query, history)  # 🔍 Comentar para usar embbedings
+    #documentos = await recuperar_documentos_hibrido(query, history)  # 🔍 Comentar para usar solo embeddings
+
+    # 3️⃣ Reordenamiento de documentos (Opcional)
+   # documentos = await reordenar_documentos(query, documentos)  # 📄 Comentar si no quieres usar reranking
+
+    if not documentos:
+        raise _SinDocumentos()
+    return tuple((doc.page_content, doc.metadata) for doc in documentos)
 
 # ==========================================
 # PREPARACIÓN PARA MULTIQUERY RETRIEVER
 # ==========================================
 
-def recuperar_documentos_multiquery(query: str, history: list) -> list:
+async def recuperar_documentos_multiquery(query: str, history: list) -> list:
     """
     📌 Recupera documentos usando `MultiQuery Retriever`.
 
@@ -353,21 +542,65 @@ def recuperar_documentos_multiquery(query: str, history: list) -> list:
         list: Lista de documentos únicos encontrados.
     """
     try:
-        # ✅ Configuramos el retriever MultiQuery con el modelo de lenguaje
-        multiquery_retriever = MultiQueryRetriever.from_llm(
-            retriever=retriever,  # 🔍 Base de datos vectorial
-            llm=llm,  # 🧠 Modelo de lenguaje para generar consultas múltiples
-            include_original=True  # ✅ Incluir la consulta original en la búsqueda
-        )
-
-        # ✅ Ejecutamos la recuperación con múltiples consultas generadas
-        documentos_multiquery = multiquery_retriever.get_relevant_documents(query)
+        documentos_unicos = await _multiquery_cached(_Consulta(query))
 
-        # ✅ Eliminamos duplicados usando `page_content` como clave
-        documentos_unicos = {doc.page_content: doc for doc in documentos_multiquery}.values()
-
-        return list(documentos_unicos)
+        # ✅ Reconstruimos los documentos desde la caché
+        return [
+            Document(page_content=contenido, metadata=dict(metadata))
+            for contenido, metadata in documentos_unicos
+        ]
 
     except Exception as e:
-        logger.error(f"❌ Error en recuperación MultiQuery: {str(e)}")
+        logger.error("❌ Error en recuperación MultiQuery: %s", e)
         return []
+
+@lru_cache(maxsize=1)
+def _get_multiquery_semaphore() -> asyncio.Semaphore:
+    """Semáforo compartido que limita las búsquedas simultáneas del MultiQuery"""
+    return asyncio.Semaphore(get_settings().MULTIQUERY_CONCURRENCY)
+
+@alru_cache(maxsize=QUERY_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+async def _multiquery_cached(consulta: _Consulta) -> tuple:
+    """
+    Recuperación MultiQuery memoizada por consulta normalizada (el LLM y el
+    embedder reciben el texto original).
+
+    Las variantes generadas por el LLM se embeben en una sola llamada
+    (`aembed_documents`) y luego se buscan por vector en Chroma en paralelo,
+    en lugar de una llamada de embeddings por variante.
+
+    Solo se guardan tuplas (page_content, metadata) para no retener los
+    objetos Document completos en la caché.
+    """
+    multiquery_retriever = get_multiquery_retriever()
+    query = consulta.texto
+
+    # ✅ Generamos las variantes de la consulta (una sola llamada al LLM);
+    # agenerate_queries normaliza la salida de la cadena (LCEL o LLMChain)
+    variantes = await multiquery_retriever.agenerate_queries(
+        query, AsyncCallbackManagerForRetrieverRun.get_noop_manager()
+    )
+    consultas = [q for q in variantes if q.strip()]
+    if multiquery_retriever.include_original:
+        consultas.append(query)
+
+    # ✅ Embebemos todas las variantes en un único request a OpenAI
+    vectores = await get_embeddings().aembed_documents(consultas)
+
+    # ✅ Buscamos todos los vectores en la base en paralelo (con un límite
+    # de búsquedas simultáneas, ver MULTIQUERY_CONCURRENCY)
+    k = get_settings().RETRIEVER_K
+    db = get_db()
+    semaforo = _get_multiquery_semaphore()
+
+    async def _buscar(vector):
+        async with semaforo:
+            return await db.asimilarity_search_by_vector(vector, k=k)
+
+    resultados = await asyncio.gather(*(_buscar(vector) for vector in vectores))
+    documentos_multiquery = [doc for docs in resultados for doc in docs]
+
+    # ✅ Eliminamos duplicados conservando el orden
+    documentos_unicos = _deduplicar(documentos_multiquery)
+
+    return tuple((doc.page_content, doc.metadata) for doc in documentos_unicos)
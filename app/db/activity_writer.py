@@ -0,0 +1,151 @@
+"""
+Escritura Diferida de Actividades - UDCito API
+=============================================
+
+Este módulo agrupa los registros de `UserActivity` en memoria y los inserta
+en lote, en lugar de hacer un INSERT + commit por cada actividad.
+
+Funcionamiento:
+- `record_activity()` encola la actividad (no toca la base de datos)
+- Una tarea en segundo plano vacía la cola cada `flush_interval` segundos
+  o cada `batch_size` registros, con un único `bulk_insert_mappings`
+- Al detenerse (shutdown de la app) se escriben las actividades pendientes
+- Con la cola llena la actividad se descarta (y se cuenta en `dropped`):
+  nunca se hace un commit dentro del event loop
+
+Autor: Jose Lacunza Kobs
+Fecha: Noviembre 2024
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from app.db.base import db_manager
+from app.db.models import UserActivity
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
+
+class ActivityWriter:
+    """
+    Escritor en lote de actividades de usuario.
+
+    Se inicia y detiene desde el `lifespan` de FastAPI. Si no fue iniciado,
+    cada actividad se escribe en un hilo del executor del loop (o de forma
+    directa si no hay loop corriendo, por ejemplo en scripts).
+    """
+
+    def __init__(self, max_queue: int = 10_000, batch_size: int = 200, flush_interval: float = 0.5):
+        self._max_queue = max_queue
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0  # Actividades descartadas por cola llena
+
+    async def start(self):
+        """Crea la cola e inicia la tarea de escritura en segundo plano"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        self._task = asyncio.create_task(self._run())
+        logger.info("Escritor de actividades iniciado")
+
+    async def stop(self):
+        """Detiene la tarea de escritura y persiste las actividades pendientes"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        pendientes = []
+        while not self._queue.empty():
+            pendientes.append(self._queue.get_nowait())
+        self._queue = None
+
+        if pendientes:
+            await asyncio.to_thread(self._flush, pendientes)
+        logger.info(f"Escritor de actividades detenido ({len(pendientes)} pendientes escritas)")
+
+    def record_activity(self, user_email: str, activity_type: str, details: Dict = None):
+        """
+        Registra una actividad de usuario para su inserción en lote.
+
+        Debe llamarse desde el hilo del event loop: `asyncio.Queue` no es
+        segura entre hilos.
+
+        Args:
+            user_email: Email del usuario
+            activity_type: Tipo de actividad
+            details: Detalles adicionales
+        """
+        row = {
+            'id': str(uuid4()),
+            'user_email': user_email,
+            'activity_type': activity_type,
+            'details': details or {},
+            'ts_ms': time.time_ns() // 1_000_000  # Epoch UTC en milisegundos
+        }
+
+        if self._queue is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # Sin event loop (scripts): escribir en el momento no bloquea a nadie
+                self._flush([row])
+            else:
+                loop.run_in_executor(None, self._flush, [row])
+            return
+
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Cola de actividades llena, actividad descartada ({self.dropped} en total)")
+
+    async def _run(self):
+        """Agrupa actividades de la cola y las escribe en lote"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = loop.time() + self._flush_interval
+                while len(batch) < self._batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            finally:
+                # También al cancelar la tarea, para no perder el lote en curso
+                await asyncio.to_thread(self._flush, batch)
+
+    def _flush(self, rows: List[Dict]):
+        """
+        Inserta un lote de actividades en una sola transacción.
+
+        Args:
+            rows: Actividades a insertar
+        """
+        try:
+            with db_manager.get_db() as db:
+                db.bulk_insert_mappings(UserActivity, rows)
+                db.commit()
+        except Exception as e:
+            logger.error(f"Error escribiendo {len(rows)} actividades: {str(e)}")
+
+# Instancia global del escritor de actividades
+activity_writer = ActivityWriter()
+
+def record_activity(user_email: str, activity_type: str, details: Dict = None):
+    """Utilidad para registrar una actividad con el escritor global"""
+    activity_writer.record_activity(user_email, activity_type, details)
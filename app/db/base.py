@@ -17,7 +17,7 @@ Autor: Jose Lacunza
 Fecha: Noviembre 2024
 """
 
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.engine import Engine
 from contextlib import contextmanager
@@ -26,9 +26,22 @@ from pathlib import Path
 import logging
 from typing import Generator, Optional
 
+from app.config import get_settings
+
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """Configura opciones de SQLite para mejor performance en cada conexión nueva"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # Seguro con WAL, menos fsync
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")  # ~64 MB de caché de páginas
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256 MB mapeados en memoria
+    cursor.close()
+
 class DatabaseManager:
     """
     Gestor de conexiones y configuración de base de datos.
@@ -44,13 +57,25 @@ class DatabaseManager:
         self._engine: Optional[Engine] = None
         self._SessionLocal = None
         self._connect_args = {}
+        
+        # Configuración leída una sola vez desde Settings (que también carga
+        # el .env); reconfigurar el engine no vuelve a consultarla
+        config = get_settings()
+        self._db_type = config.DB_TYPE.lower()
+        self._sqlite_path = config.SQLITE_PATH
+        self._db_url = config.DATABASE_URL
+        self._sql_echo = config.SQL_ECHO
+        self._pool_size = config.DB_POOL_SIZE
+        self._pool_overflow = config.DB_POOL_OVERFLOW
+        
         self.setup_database()
         
     def setup_database(self):
         """
-        Configura la conexión a la base de datos según variables de entorno.
+        Configura la conexión a la base de datos según la configuración
+        (leída en __init__ desde app.config).
         
-        Variables de entorno utilizadas:
+        Valores utilizados:
         - DB_TYPE: Tipo de base de datos ('sqlite', 'postgresql', 'mysql')
         - DB_HOST: Host de la base de datos
         - DB_PORT: Puerto de la base de datos
@@ -58,65 +83,29 @@ class DatabaseManager:
         - DB_PASSWORD: Contraseña
         - DB_NAME: Nombre de la base de datos
         - SQLITE_PATH: Ruta para archivo SQLite
+        - DB_POOL_SIZE / DB_POOL_OVERFLOW: Tamaño del pool (solo PostgreSQL/MySQL)
         """
         try:
-            db_type = os.getenv('DB_TYPE', 'sqlite').lower()
+            db_type = self._db_type
             
             if db_type == 'sqlite':
-                db_url = self._setup_sqlite()
-            else:
-                db_url = self._setup_sql_database(db_type)
+                self._setup_sqlite()
                 
-            self._create_engine(db_url)
+            # La URL se construye en un único lugar (Settings.DATABASE_URL)
+            self._create_engine(self._db_url)
             logger.info(f"Base de datos configurada exitosamente: {db_type}")
             
         except Exception as e:
             logger.error(f"Error configurando base de datos: {str(e)}")
             raise
 
-    def _setup_sqlite(self) -> str:
-        """
-        Configura base de datos SQLite
-        
-        Returns:
-            URL de conexión para SQLite
-        """
+    def _setup_sqlite(self):
+        """Configura base de datos SQLite (crea el directorio del archivo)"""
         # Configurar ruta de SQLite
-        db_path = Path(os.getenv('SQLITE_PATH', './data/sqlite'))
+        db_path = Path(self._sqlite_path)
         db_path.mkdir(parents=True, exist_ok=True)
         
-        db_file = db_path / 'udcito.db'
         self._connect_args = {"check_same_thread": False}
-        
-        # Configurar eventos específicos de SQLite
-        @event.listens_for(Engine, "connect")
-        def set_sqlite_pragma(dbapi_connection, connection_record):
-            """Configura opciones de SQLite para mejor performance"""
-            cursor = dbapi_connection.cursor()
-            cursor.execute("PRAGMA foreign_keys=ON")
-            cursor.execute("PRAGMA journal_mode=WAL")
-            cursor.close()
-            
-        return f"sqlite:///{db_file}"
-
-    def _setup_sql_database(self, db_type: str) -> str:
-        """
-        Configura base de datos SQL (PostgreSQL/MySQL)
-        
-        Args:
-            db_type: Tipo de base de datos ('postgresql' o 'mysql')
-            
-        Returns:
-            URL de conexión para la base de datos
-        """
-        # Obtener configuración
-        db_user = os.getenv('DB_USER', 'udcito')
-        db_pass = os.getenv('DB_PASSWORD', 'udcito')
-        db_host = os.getenv('DB_HOST', 'localhost')
-        db_port = os.getenv('DB_PORT', '5432')
-        db_name = os.getenv('DB_NAME', 'udcito')
-        
-        return f"{db_type}://{db_user}:{db_pass}@{db_host}:{db_port}/{db_name}"
 
     def _create_engine(self, db_url: str):
         """
@@ -125,15 +114,33 @@ class DatabaseManager:
         Args:
             db_url: URL de conexión a la base de datos
         """
+        # SQLite usa el pool por defecto de SQLAlchemy: las conexiones a un
+        # archivo local son baratas y WAL es quien limita la concurrencia.
+        # Para servidores SQL, pool LIFO (mantiene "calientes" pocas
+        # conexiones) y límites configurables.
+        pool_kwargs = {}
+        if self._db_type != 'sqlite':
+            pool_kwargs = {
+                "pool_use_lifo": True,
+                "pool_size": self._pool_size,
+                "max_overflow": self._pool_overflow,
+                "pool_recycle": 1800,
+                "pool_timeout": 10
+            }
+        
         self._engine = create_engine(
             db_url,
             connect_args=self._connect_args,
             pool_pre_ping=True,
-            pool_size=5,
-            max_overflow=10,
-            echo=os.getenv('SQL_ECHO', '').lower() == 'true'
+            echo=self._sql_echo,
+            **pool_kwargs
         )
         
+        # Opciones de SQLite: se registran sobre este engine (no sobre la
+        # clase Engine global) para no duplicarlas ni aplicarlas a otros engines
+        if self._db_type == 'sqlite':
+            event.listen(self._engine, "connect", _set_sqlite_pragma)
+        
         self._SessionLocal = sessionmaker(
             autocommit=False,
             autoflush=False,
@@ -174,6 +181,38 @@ class DatabaseManager:
             raise RuntimeError("Engine de base de datos no inicializado")
         return self._engine
 
+    def warm_pool(self) -> int:
+        """
+        Abre de antemano las conexiones del pool ejecutando `SELECT 1` en cada
+        una, para que el primer request no pague el costo de conectarse.
+        
+        Returns:
+            Cantidad de conexiones precalentadas
+        """
+        engine = self.get_engine()
+        size_fn = getattr(engine.pool, "size", None)
+        size = size_fn() if callable(size_fn) else 1
+        
+        conns = []
+        try:
+            for _ in range(size):
+                conn = engine.connect()
+                conns.append(conn)
+                conn.execute(text("SELECT 1"))
+            logger.info(f"Pool de conexiones precalentado: {len(conns)} conexiones")
+        except Exception as e:
+            logger.error(f"Error precalentando el pool de conexiones: {str(e)}")
+        finally:
+            # Devolverlas al pool, que las conserva abiertas
+            for conn in conns:
+                conn.close()
+        return len(conns)
+
+    def dispose(self):
+        """Cierra todas las conexiones del pool"""
+        if self._engine:
+            self._engine.dispose()
+
     def check_connection(self) -> bool:
         """
         Verifica la conexión a la base de datos
@@ -182,8 +221,9 @@ class DatabaseManager:
             True si la conexión es exitosa, False en caso contrario
         """
         try:
-            with self.get_db() as db:
-                db.execute("SELECT 1")
+            # Conexión directa: no hace falta una sesión ORM para un SELECT 1
+            with self.get_engine().connect() as conn:
+                conn.execute(text("SELECT 1"))
             return True
         except Exception as e:
             logger.error(f"Error verificando conexión: {str(e)}")
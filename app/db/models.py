@@ -13,10 +13,12 @@ Autor: Jose Lacunza Kobs
 Fecha: Noviembre 2024
 """
 
-from sqlalchemy import Column, String, Boolean, DateTime, Enum as SQLEnum, JSON
-from sqlalchemy.sql import func
+from sqlalchemy import Column, String, Boolean, DateTime, BigInteger, Enum as SQLEnum, JSON, ForeignKey, Index
+from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy.sql import func, text
 from enum import Enum
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 from typing import Dict, Optional
 
 # === Enumeraciones ===
@@ -34,7 +36,7 @@ class UserRole(str, Enum):
     USER = "user"
 
     @classmethod
-    def get_permissions(cls, role: str) -> list:
+    def get_permissions(cls, role: str) -> tuple:
         """
         Retorna los permisos asociados a cada rol
         
@@ -42,17 +44,24 @@ class UserRole(str, Enum):
             role: Rol del usuario
             
         Returns:
-            Lista de permisos disponibles para el rol
+            Tupla (inmutable) de permisos disponibles para el rol
         """
-        PERMISSIONS = {
-            cls.ADMIN: ['all'],
-            cls.VALIDATOR: ['validate_content', 'view_users', 'edit_content'],
-            cls.USER: ['view_content', 'ask_questions']
-        }
-        return PERMISSIONS.get(role, [])
+        return _ROLE_PERMISSIONS.get(role, ())
+
+# Permisos por rol: se construyen una sola vez al importar el módulo
+_ROLE_PERMISSIONS = {
+    UserRole.ADMIN: ('all',),
+    UserRole.VALIDATOR: ('validate_content', 'view_users', 'edit_content'),
+    UserRole.USER: ('view_content', 'ask_questions')
+}
+
+# === Base Declarativa ===
+class Base(DeclarativeBase):
+    """Clase base de todos los modelos ORM (registra tablas en Base.metadata)"""
+    pass
 
 # === Modelos ===
-class User:
+class User(Base):
     """
     Modelo de Usuario
     
@@ -64,7 +73,7 @@ class User:
     __tablename__ = "users"
 
     # Campos de identificación
-    email = Column(String, primary_key=True, index=True, 
+    email = Column(String, primary_key=True, 
                   comment="Email del usuario (identificador principal)")
     google_id = Column(String, unique=True, index=True, 
                       comment="ID único de Google")
@@ -97,8 +106,20 @@ class User:
                        comment="Email del admin que creó el usuario")
     
     # Datos adicionales
-    metadata = Column(JSON, default=dict, 
-                     comment="Información adicional en formato JSON")
+    # (`metadata` está reservado por SQLAlchemy en los modelos declarativos;
+    # el atributo se llama distinto pero la columna conserva su nombre)
+    extra_metadata = Column("metadata", JSON, default=dict, 
+                           comment="Información adicional en formato JSON")
+    
+    # Relaciones
+    # La colección puede crecer sin límite: no se carga por defecto; las
+    # consultas que la necesiten usan `.options(selectinload(User.activities))`
+    activities = relationship(
+        "UserActivity",
+        back_populates="user",
+        order_by="UserActivity.ts_ms.desc()",
+        lazy="select"
+    )
 
     def to_dict(self) -> Dict:
         """
@@ -128,13 +149,20 @@ class User:
         }
 
     @classmethod
-    def from_google_info(cls, google_info: Dict, role: UserRole = UserRole.USER) -> 'User':
+    def from_google_info(
+        cls,
+        google_info: Dict,
+        role: UserRole = UserRole.USER,
+        now: Optional[datetime] = None
+    ) -> 'User':
         """
         Crea una instancia de Usuario desde la información de Google.
         
         Args:
             google_info: Información proporcionada por Google OAuth
             role: Rol inicial del usuario
+            now: Momento de creación; permite reutilizar un mismo timestamp
+                 al crear muchos usuarios (por defecto, la hora actual UTC)
             
         Returns:
             Nueva instancia de User
@@ -148,17 +176,17 @@ class User:
             full_name=google_info.get('name'),
             picture_url=google_info.get('picture'),
             locale=google_info.get('locale'),
-            metadata={
+            extra_metadata={
                 'google_verified_email': google_info.get('email_verified', False),
                 'hd': google_info.get('hd'),  # hosted domain
                 'creation_context': {
-                    'timestamp': datetime.utcnow().isoformat(),
+                    'timestamp': (now or datetime.utcnow()).isoformat(),
                     'source': 'google_oauth'
                 }
             }
         )
 
-class UserActivity:
+class UserActivity(Base):
     """
     Modelo para registro de actividades de usuarios
     
@@ -166,32 +194,50 @@ class UserActivity:
     útil para auditoría y seguimiento.
     """
     __tablename__ = "user_activities"
+    __table_args__ = (
+        # Cubren "últimas actividades de un usuario" (con y sin filtro por tipo)
+        # sin ordenar en memoria; el prefijo user_email hace innecesario
+        # un índice propio sobre esa columna
+        Index("ix_activities_user_ts", "user_email", text("ts_ms DESC")),
+        Index("ix_activities_user_type_ts", "user_email", "activity_type", text("ts_ms DESC")),
+    )
 
     # Campos principales
     id = Column(String, primary_key=True, 
                 comment="Identificador único de la actividad (UUID)")
-    user_email = Column(String, index=True, 
+    user_email = Column(String, ForeignKey("users.email"), 
                        comment="Email del usuario que realizó la actividad")
     activity_type = Column(String, 
                           comment="Tipo de actividad (login, update_role, etc)")
-    timestamp = Column(DateTime, server_default=func.now(), 
-                      comment="Momento de la actividad")
+    ts_ms = Column(BigInteger, nullable=False, default=lambda: time.time_ns() // 1_000_000,
+                   comment="Momento de la actividad (epoch UTC en milisegundos)")
     
     # Detalles adicionales
     details = Column(JSON, default=dict, 
                     comment="Información adicional de la actividad")
+    
+    # Relaciones (muchos-a-uno, diferida: las consultas de actividades no leen
+    # el usuario; si alguna lo necesita usa `.options(selectinload(UserActivity.user))`)
+    user = relationship("User", back_populates="activities", lazy="select")
+
+    @property
+    def timestamp(self) -> Optional[datetime]:
+        """Momento de la actividad como datetime UTC (se convierte solo al leerlo)"""
+        if self.ts_ms is None:
+            return None
+        return datetime.fromtimestamp(self.ts_ms / 1000, tz=timezone.utc)
 
     def to_dict(self) -> Dict:
         """
         Convierte la actividad a un diccionario
         
         Returns:
-            Dict con la información de la actividad
+            Dict con la información de la actividad (`timestamp` en epoch ms)
         """
         return {
             'id': self.id,
             'user_email': self.user_email,
             'activity_type': self.activity_type,
-            'timestamp': self.timestamp.isoformat(),
+            'timestamp': self.ts_ms,
             'details': self.details
         }
\ No newline at end of file
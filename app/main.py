@@ -11,17 +11,31 @@ Versión: 1.0.0
 """
 
 # === Importaciones Estándar ===
+import asyncio
 import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Literal, Optional
 
 # === Importaciones FastAPI ===
 from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict, Field
+from sse_starlette.sse import EventSourceResponse
 
 # === Importaciones Locales ===
-from app.core import recuperar_documentos, consultar_llm
+from app.core import (
+    recuperar_documentos,
+    consultar_llm,
+    consultar_llm_stream,
+    test_openai_connection,
+    initialize_services,
+    get_multiquery_retriever,
+    close_services
+)
+from app.db.base import db_manager
+from app.db.activity_writer import activity_writer
 from app.monitoring.health import health_checker
 from app.monitoring.metrics import metrics_collector
 
@@ -37,9 +51,10 @@ class Question(BaseModel):
 
 class ChatMessage(BaseModel):
     """Modelo para los mensajes del chat"""
-    role: str = Field(
+    model_config = ConfigDict(frozen=True)
+    
+    role: Literal["user", "assistant"] = Field(
         ..., 
-        pattern="^(user|assistant)$",
         description="Rol del mensaje (usuario o asistente)"
     )
     content: str = Field(
@@ -74,8 +89,35 @@ class ChatResponse(BaseModel):
         description="Respuesta del asistente"
     )
 
+# === Ciclo de Vida ===
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Inicialización y cierre de recursos compartidos
+    
+    Al arrancar construye los clientes de OpenAI/Chroma, precalienta el
+    pool de conexiones de la base de datos e inicia el escritor de
+    actividades y el recolector de métricas; al terminar escribe las
+    actividades pendientes, cierra el pool y el cliente HTTP compartido
+    de OpenAI.
+    """
+    # Construcción síncrona de los clientes (carga de Chroma incluida) en un
+    # hilo: si quedara para la primera consulta bloquearía el event loop
+    await asyncio.to_thread(initialize_services)
+    await asyncio.to_thread(get_multiquery_retriever)
+    await asyncio.to_thread(db_manager.warm_pool)
+    await activity_writer.start()
+    await metrics_collector.start()
+    yield
+    await metrics_collector.stop()
+    await activity_writer.stop()
+    await close_services()
+    db_manager.dispose()
+
 # === Inicialización de la Aplicación ===
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,  # Serialización JSON con orjson
     title="UDCito API",
     description="API para el asistente virtual de la Universidad del Chubut",
     version="1.0.0",
@@ -102,24 +144,19 @@ async def metrics_middleware(request, call_next):
         request: Request entrante
         call_next: Siguiente middleware o endpoint
     """
-    start_time = time.time()
+    start = time.perf_counter_ns()  # Reloj monotónico (no afectado por ajustes de hora)
+    success = False
     try:
-        # Procesar la request
+        # Procesar la request; los errores 5xx cuentan como fallidos
         response = await call_next(request)
-        
-        # Registrar métricas de éxito
-        metrics_collector.record_request(
-            success=True,
-            response_time=time.time() - start_time
-        )
+        success = response.status_code < 500
         return response
-    except Exception as e:
-        # Registrar métricas de error
+    finally:
+        # Se registra una única vez, haya o no excepción
         metrics_collector.record_request(
-            success=False,
-            response_time=time.time() - start_time
+            success=success,
+            response_time_ns=time.perf_counter_ns() - start
         )
-        raise
 
 # === Endpoints de Monitoreo ===
 @app.get(
@@ -128,14 +165,43 @@ async def metrics_middleware(request, call_next):
     summary="Verificar estado del sistema",
     description="Realiza un health check completo del sistema y sus componentes"
 )
-async def health_check():
+async def health_check(force: bool = False):
     """
     Endpoint de health check que verifica el estado del sistema
     
+    Args:
+        force (bool): Ignorar el resultado cacheado (30 s) y verificar nuevamente
+    
+    Returns:
+        ORJSONResponse: Estado actual del sistema y sus componentes
+    """
+    # Se serializa directo con orjson (maneja datetime de forma nativa),
+    # sin la pasada extra de jsonable_encoder de FastAPI
+    health = await health_checker.check_health(force=force)
+    return ORJSONResponse(health.model_dump())
+
+@app.get(
+    "/health/openai",
+    tags=["Monitoreo"],
+    summary="Verificar conexión con OpenAI",
+    description="Verifica la conexión con OpenAI mediante una consulta de embeddings"
+)
+async def health_openai():
+    """
+    Endpoint que verifica la conexión con OpenAI bajo demanda
+    
     Returns:
-        dict: Estado actual del sistema y sus componentes
+        dict: Estado de la conexión
+    
+    Raises:
+        HTTPException: 503 si no se pudo establecer conexión
     """
-    return await health_checker.check_health()
+    if not await test_openai_connection():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="No se pudo establecer conexión con OpenAI"
+        )
+    return {"status": "healthy"}
 
 @app.get(
     "/metrics",
@@ -152,6 +218,24 @@ async def get_metrics():
     """
     return metrics_collector.get_current_metrics()
 
+@app.get(
+    "/metrics/history",
+    tags=["Monitoreo"],
+    summary="Obtener historial de peticiones",
+    description="Retorna las últimas peticiones registradas (marca de tiempo, éxito y tiempo de respuesta)"
+)
+async def get_metrics_history(limit: Optional[int] = None):
+    """
+    Endpoint para obtener el historial reciente de peticiones
+    
+    Args:
+        limit: Cantidad máxima de registros a retornar (los más recientes)
+    
+    Returns:
+        list: Registros de la ventana de métricas, del más antiguo al más reciente
+    """
+    return metrics_collector.get_history(limit)
+
 # === Endpoints del Chat ===
 @app.post(
     "/recuperar_documentos",
@@ -180,8 +264,9 @@ async def recuperar_docs(question: Question):
         )
 
     try:
-        documentos = recuperar_documentos(question.question)
-        return DocumentResponse(documentos=[doc.page_content for doc in documentos])
+        documentos = await recuperar_documentos(question.question)
+        # Respuesta directa: evita revalidar la lista con DocumentResponse
+        return ORJSONResponse({"documentos": [doc.page_content for doc in documentos]})
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -216,22 +301,65 @@ async def consultar(request: ChatRequest):
 
     try:
         # Recuperar documentos relevantes
-        contexto = recuperar_documentos(request.question, request.history)
+        contexto = await recuperar_documentos(request.question, request.history)
         print(contexto)   
         # Consultar al LLM
-        respuesta = consultar_llm(
+        respuesta = await consultar_llm(
             contexto, 
             request.question,
-            [{"role": msg.role, "content": msg.content} for msg in request.history]
+            request.history
         )
         
-        return ChatResponse(reply=respuesta)
+        return ChatResponse.model_construct(reply=respuesta)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error en la consulta: {str(e)}"
+        )
+
+@app.post(
+    "/consultar/stream",
+    tags=["Chat"],
+    summary="Consultar al asistente (streaming)",
+    description="Igual que /consultar, pero envía la respuesta como Server-Sent Events a medida que se genera"
+)
+async def consultar_stream(request: ChatRequest):
+    """
+    Endpoint de consulta con streaming de la respuesta
+    
+    Args:
+        request (ChatRequest): Pregunta actual e historial de chat
+    
+    Returns:
+        EventSourceResponse: Fragmentos de la respuesta como eventos SSE
+    
+    Raises:
+        HTTPException: Si hay error en la recuperación de contexto
+    """
+    if not request.question.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La pregunta no puede estar vacía"
+        )
+
+    try:
+        # Recuperar documentos relevantes
+        contexto = await recuperar_documentos(request.question, request.history)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error en la consulta: {str(e)}"
         )
 
+    # Si el cliente se desconecta, el generador se cancela y se corta la generación
+    return EventSourceResponse(
+        consultar_llm_stream(
+            contexto,
+            request.question,
+            request.history
+        )
+    )
+
 # === Inicio de la Aplicación ===
 if __name__ == "__main__":
     import uvicorn
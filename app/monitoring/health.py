@@ -3,6 +3,7 @@ Módulo de Health Check para UDCito con logging detallado
 """
 
 import os
+import asyncio
 import psutil
 import time
 import logging
@@ -10,6 +11,8 @@ from datetime import datetime
 from typing import Dict, List
 from pydantic import BaseModel, Field
 
+from app.config import get_settings
+
 # === Configuración de Logging ===
 logger = logging.getLogger("health_check")
 logger.setLevel(logging.INFO)
@@ -52,25 +55,43 @@ class HealthChecker:
     """Clase para realizar verificaciones detalladas del sistema"""
     
     def __init__(self):
+        config = get_settings()
         self.version = "1.0.0"
-        self.environment = os.getenv("ENVIRONMENT", "development")
+        self.environment = config.ENVIRONMENT
         self._last_check = None
+        self._last_check_time = 0.0
         self._check_interval = 30
+        self._check_lock = asyncio.Lock()
+        
+        # Configuración leída una sola vez (incluye el .env, ver app.config)
+        self._chroma_path = config.CHROMA_PATH
+        self._debug_mode = config.DEBUG
+        self._workers = config.WORKERS
+        self._startup_time = datetime.now().isoformat()
+        
+        # Valores constantes durante la vida del proceso
+        self._cpu_count = psutil.cpu_count()
+        self._boot_time = psutil.boot_time()
+        self._disk_total_gb = round(psutil.disk_usage('/').total / (1024**3), 2)
+        
+        # Primera lectura de CPU: inicializa el contador para que las
+        # siguientes con interval=None no bloqueen
+        psutil.cpu_percent(interval=None)
         logger.info(f"🚀 Iniciando HealthChecker v{self.version} en ambiente {self.environment}")
 
     def _check_system(self) -> SystemCheck:
         """Verifica el estado del sistema"""
         try:
-            cpu = psutil.cpu_percent(interval=1)
+            cpu = psutil.cpu_percent(interval=None)  # Desde la lectura anterior, sin bloquear
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage('/')
-            uptime = time.time() - psutil.boot_time()
+            uptime = time.time() - self._boot_time
             
             details = {
                 "total_memory_gb": round(memory.total / (1024**3), 2),
                 "available_memory_gb": round(memory.available / (1024**3), 2),
-                "total_disk_gb": round(disk.total / (1024**3), 2),
-                "cpu_count": psutil.cpu_count()
+                "total_disk_gb": self._disk_total_gb,
+                "cpu_count": self._cpu_count
             }
             
             status = "healthy"
@@ -107,7 +128,7 @@ class HealthChecker:
     def _check_database(self) -> DatabaseCheck:
         """Verifica el estado de la base de datos"""
         try:
-            chroma_path = os.getenv('CHROMA_PATH', '/app/data/chroma')
+            chroma_path = self._chroma_path
             path_exists = os.path.exists(chroma_path)
             path_writable = os.access(chroma_path, os.W_OK) if path_exists else False
             
@@ -149,9 +170,9 @@ class HealthChecker:
         """Verifica el estado de la API"""
         try:
             details = {
-                "startup_time": datetime.now().isoformat(),
-                "debug_mode": os.getenv("DEBUG", "False") == "True",
-                "workers": int(os.getenv("WORKERS", 4))
+                "startup_time": self._startup_time,
+                "debug_mode": self._debug_mode,
+                "workers": self._workers
             }
             
             logger.info(f"🌐 API - Estado: healthy")
@@ -173,18 +194,48 @@ class HealthChecker:
                 details={"error": str(e)}
             )
 
-    async def check_health(self) -> HealthResponse:
+    async def check_health(self, force: bool = False) -> HealthResponse:
+        """
+        Retorna el estado del sistema, reutilizando el último resultado
+        durante `_check_interval` segundos.
+        
+        Los probes concurrentes esperan al mismo cálculo en lugar de
+        disparar uno cada uno.
+        
+        Args:
+            force: Ignorar la caché y verificar nuevamente
+        """
+        async with self._check_lock:
+            if (
+                not force
+                and self._last_check is not None
+                and time.monotonic() - self._last_check_time < self._check_interval
+            ):
+                return self._last_check
+            
+            self._last_check = await self._run_checks()
+            self._last_check_time = time.monotonic()
+            return self._last_check
+
+    async def _run_checks(self) -> HealthResponse:
         """Realiza una verificación completa del sistema"""
         logger.info("\n🔍 Iniciando verificación de salud del sistema")
         
+        # Las verificaciones hacen syscalls bloqueantes: se ejecutan en
+        # threads y en paralelo para no frenar el event loop
+        system, database, api = await asyncio.gather(
+            asyncio.to_thread(self._check_system),
+            asyncio.to_thread(self._check_database),
+            asyncio.to_thread(self._check_api)
+        )
         checks = {
-            "system": self._check_system(),
-            "database": self._check_database(),
-            "api": self._check_api()
+            "system": system,
+            "database": database,
+            "api": api
         }
         
         checks_dict = {
-            name: check.dict() 
+            name: check.model_dump()
             for name, check in checks.items()
         }
         
@@ -196,8 +247,10 @@ class HealthChecker:
 
         logger.info(f"\n✨ Resultado Final: {overall_status}")
         
-        return HealthResponse(
+        # Los datos ya vienen validados: se construye sin volver a validar
+        return HealthResponse.model_construct(
             overall_status=overall_status,
+            timestamp=datetime.now(),
             checks=checks_dict,
             environment=self.environment,
             version=self.version
@@ -3,11 +3,14 @@ Módulo de métricas para UDCito
 Recopila y gestiona métricas del sistema
 """
 
+import asyncio
 import time
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional
 from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -15,11 +18,27 @@ class MetricsCollector:
     """
     Recolector de métricas del sistema
     Mantiene un historial de métricas para análisis
+    
+    El historial es un buffer circular de `max_history` posiciones guardado
+    como arrays de NumPy por columna (timestamp, éxito, tiempo de respuesta),
+    preasignados: registrar una petición no crea objetos nuevos.
+    
+    Con el recolector iniciado (lifespan de FastAPI), `record_request` solo
+    encola la muestra; una tarea en segundo plano las vuelca en lote cada
+    `flush_interval` segundos. Sin iniciar, se aplican en el momento.
     """
     
-    def __init__(self, max_history: int = 1000):
+    def __init__(self, max_history: int = 1000, batch_size: int = 1000, flush_interval: float = 0.25):
         self.max_history = max_history
-        self.metrics_history = deque(maxlen=max_history)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._pending: deque = deque()  # (epoch, éxito, tiempo en ns)
+        self._task: Optional[asyncio.Task] = None
+        self._ts = np.zeros(max_history, dtype='f8')  # Epoch en segundos
+        self._ok = np.zeros(max_history, dtype='u1')  # 1 si la petición fue exitosa
+        self._rt = np.zeros(max_history, dtype='i8')  # Tiempo de respuesta en ns
+        self._head = 0  # Próxima posición a escribir
+        self._n = 0  # Posiciones ocupadas
         self.start_time = datetime.now()
         
         # Contadores de uso
@@ -27,34 +46,122 @@ class MetricsCollector:
         self.successful_queries = 0
         self.failed_queries = 0
         
-        # Tiempos de respuesta
-        self.response_times: List[float] = deque(maxlen=1000)
+        # Caché de recuperación de documentos
+        self.cache_lookups = 0
+        self.cache_misses = 0
+        
+        # Suma de los tiempos de la ventana, mantenida en forma incremental
+        self._rt_sum = 0
     
-    def record_request(self, success: bool, response_time: float):
-        """Registra una petición al sistema"""
-        self.requests_total += 1
-        if success:
-            self.successful_queries += 1
+    def record_request(self, success: bool, response_time_ns: int):
+        """
+        Registra una petición al sistema
+        
+        Args:
+            success: Si la petición terminó sin error del servidor
+            response_time_ns: Duración en nanosegundos (time.perf_counter_ns)
+        """
+        sample = (time.time(), success, response_time_ns)
+        if self._task is None:
+            self._apply([sample])
         else:
-            self.failed_queries += 1
+            self._pending.append(sample)
+    
+    async def start(self):
+        """Inicia la tarea que vuelca las muestras pendientes en lote"""
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("Recolector de métricas iniciado")
+    
+    async def stop(self):
+        """Detiene la tarea de volcado y aplica las muestras pendientes"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._flush()
+    
+    async def _run(self):
+        """Vuelca periódicamente las muestras pendientes"""
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            self._flush()
+    
+    def _flush(self):
+        """Aplica todas las muestras pendientes, en lotes de `batch_size`"""
+        pending = self._pending
+        while pending:
+            batch = [pending.popleft() for _ in range(min(len(pending), self._batch_size))]
+            self._apply(batch)
+    
+    def _apply(self, samples: List[Tuple[float, bool, int]]):
+        """
+        Agrega un lote de muestras a los contadores y al buffer circular
         
-        self.response_times.append(response_time)
+        Args:
+            samples: Tuplas (epoch, éxito, tiempo de respuesta en ns)
+        """
+        ts, ok, rt = zip(*samples)
+        ts = np.array(ts, dtype='f8')
+        ok = np.array(ok, dtype='u1')
+        rt = np.array(rt, dtype='i8')
         
-        # Registrar en el historial
-        metric = {
-            'timestamp': datetime.now().isoformat(),
-            'success': success,
-            'response_time': response_time
-        }
-        self.metrics_history.append(metric)
+        k = len(samples)
+        n_ok = int(ok.sum())
+        self.requests_total += k
+        self.successful_queries += n_ok
+        self.failed_queries += k - n_ok
+        
+        # Del lote solo entran al historial las últimas `max_history` muestras
+        if k > self.max_history:
+            ts, ok, rt = ts[-self.max_history:], ok[-self.max_history:], rt[-self.max_history:]
+            k = self.max_history
+        
+        # Con el buffer lleno se pisan las posiciones más antiguas
+        idx = (self._head + np.arange(k)) % self.max_history
+        free = self.max_history - self._n
+        if k > free:
+            self._rt_sum -= int(self._rt[idx[free:]].sum())
+        self._ts[idx] = ts
+        self._ok[idx] = ok
+        self._rt[idx] = rt
+        self._rt_sum += int(rt.sum())
+        self._n = min(self._n + k, self.max_history)
+        self._head = (self._head + k) % self.max_history
+    
+    def record_cache_lookup(self):
+        """Registra una consulta a la caché de recuperación de documentos"""
+        self.cache_lookups += 1
+    
+    def record_cache_miss(self):
+        """Registra un fallo de la caché de recuperación (se ejecutó el pipeline)"""
+        self.cache_misses += 1
     
     def get_current_metrics(self) -> Dict:
         """Obtiene métricas actuales del sistema"""
+        self._flush()
+        
+        # Suma entera en ns (incremental, O(1)); se convierte a segundos solo al reportar
         avg_response_time = (
-            sum(self.response_times) / len(self.response_times)
-            if self.response_times else 0
+            self._rt_sum / self._n / 1e9
+            if self._n else 0
         )
         
+        # Percentiles de la ventana: np.partition ubica los dos rangos en O(n)
+        # sin ordenar el buffer completo (solo al consultar /metrics)
+        p50_response_time = p95_response_time = 0
+        n = self._n
+        if n:
+            k50, k95 = int(0.5 * (n - 1)), int(0.95 * (n - 1))
+            parted = np.partition(self._rt[:n], (k50, k95))
+            p50_response_time = float(parted[k50]) / 1e9
+            p95_response_time = float(parted[k95]) / 1e9
+        
         uptime = (datetime.now() - self.start_time).total_seconds()
         
         return {
@@ -67,19 +174,55 @@ class MetricsCollector:
                 if self.requests_total > 0 else 0
             ),
             'average_response_time': avg_response_time,
+            'p50_response_time': p50_response_time,
+            'p95_response_time': p95_response_time,
             'requests_per_minute': (
                 self.requests_total / (uptime / 60)
                 if uptime > 0 else 0
-            )
+            ),
+            'retrieval_cache_hits': max(self.cache_lookups - self.cache_misses, 0),
+            'retrieval_cache_misses': self.cache_misses
         }
     
+    def get_history(self, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Historial de peticiones de la ventana, de la más antigua a la más reciente
+        
+        Los registros tipo dict se construyen solo aquí, a partir de las
+        columnas del buffer circular; el timestamp ISO se formatea una vez
+        por segundo y se comparte entre las peticiones de ese segundo.
+        
+        Args:
+            limit: Cantidad máxima de registros (los más recientes)
+        """
+        self._flush()
+        n = self._n if limit is None else max(0, min(limit, self._n))
+        idx = (self._head - n + np.arange(n)) % self.max_history
+        
+        history = []
+        last_sec, last_iso = None, None
+        for ts, ok, rt in zip(self._ts[idx].tolist(), self._ok[idx].tolist(), self._rt[idx].tolist()):
+            sec = int(ts)
+            if sec != last_sec:
+                last_sec, last_iso = sec, datetime.fromtimestamp(sec).isoformat()
+            history.append({
+                'timestamp': last_iso,
+                'success': bool(ok),
+                'response_time': rt / 1e9
+            })
+        return history
+    
     def reset_metrics(self):
         """Reinicia los contadores de métricas"""
+        self._pending.clear()
         self.requests_total = 0
         self.successful_queries = 0
         self.failed_queries = 0
-        self.response_times.clear()
-        self.metrics_history.clear()
+        self.cache_lookups = 0
+        self.cache_misses = 0
+        self._head = 0
+        self._n = 0
+        self._rt_sum = 0
         self.start_time = datetime.now()
         logger.info("Metrics have been reset")
 
@@ -9,17 +9,39 @@ Autor: Jose Lacunza Kobs
 Fecha: Noviembre 2024
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+import jwt
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import Optional, Dict
 
-from app.services.user_service import user_service
-from app.db.models import UserRole
+from app.config import settings
+from app.services.user_services import user_service
+
+# Configuración de logging
+logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/auth", tags=["Autenticación"])
+router = APIRouter(
+    prefix="/auth",
+    tags=["Autenticación"],
+    default_response_class=ORJSONResponse  # Serialización JSON con orjson
+)
 security = HTTPBearer()
 
+# Parámetros de JWT leídos una sola vez (la clave ya codificada a bytes)
+_JWT_SECRET = settings.JWT_SECRET_KEY.encode()
+_JWT_ALGORITHM = settings.JWT_ALGORITHM
+_JWT_EXPIRE = timedelta(minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
+
+# Tiempo (segundos) que el navegador puede reutilizar el perfil sin revalidar
+PROFILE_MAX_AGE = 30
+
 # === Modelos de Datos ===
 class GoogleLoginRequest(BaseModel):
     """Modelo para solicitud de login con Google"""
@@ -39,15 +61,29 @@ class LoginResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
+def _user_response(user: Dict) -> UserResponse:
+    """
+    Arma la respuesta a partir de `User.to_dict()` (que anida el nombre y
+    trae campos extra, por eso no se pasa directo al modelo)
+    """
+    return UserResponse(
+        email=user['email'],
+        name=user['name']['full'] or '',
+        role=user['role'],
+        picture_url=user['picture_url'],
+        permissions=list(user['permissions'])
+    )
+
 # === Endpoints ===
 @router.post("/login/google", response_model=LoginResponse)
-async def google_login(request: GoogleLoginRequest):
+async def google_login(request: GoogleLoginRequest, background_tasks: BackgroundTasks):
     """
     Endpoint para login con Google OAuth.
     Verifica el token y crea/actualiza el usuario.
     
     Args:
         request: Token ID de Google
+        background_tasks: Tareas a ejecutar después de enviar la respuesta
         
     Returns:
         LoginResponse con información del usuario y token de acceso
@@ -59,20 +95,14 @@ async def google_login(request: GoogleLoginRequest):
         # Obtener o crear usuario
         user = await user_service.get_or_create_user(google_info)
         
-        # Actualizar último login
-        await user_service.update_last_login(user.email)
+        # Actualizar último login (no afecta la respuesta: se hace después de enviarla)
+        background_tasks.add_task(user_service.update_last_login, user['email'])
         
         # Generar token de acceso
-        access_token = create_access_token(user.email)
+        access_token = create_access_token(user['email'])
         
         return LoginResponse(
-            user=UserResponse(
-                email=user.email,
-                name=user.full_name,
-                role=user.role.value,
-                picture_url=user.picture_url,
-                permissions=UserRole.get_permissions(user.role)
-            ),
+            user=_user_response(user),
             access_token=access_token
         )
         
@@ -89,10 +119,17 @@ async def google_login(request: GoogleLoginRequest):
         )
 
 @router.get("/profile", response_model=UserResponse)
-async def get_profile(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def get_profile(
+    request: Request,
+    response: Response,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
     """
     Obtiene el perfil del usuario actual.
     Requiere token de autenticación.
+    
+    Responde con un `ETag` del perfil; si el cliente envía el mismo valor
+    en `If-None-Match` se devuelve 304 sin cuerpo.
     """
     try:
         # Verificar token
@@ -105,9 +142,21 @@ async def get_profile(credentials: HTTPAuthorizationCredentials = Depends(securi
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Usuario no encontrado"
             )
-            
-        return UserResponse(**profile)
         
+        # Incluye las actividades recientes, que cambian sin tocar updated_at
+        etag = f'W/"{hashlib.blake2b(orjson.dumps(profile), digest_size=16).hexdigest()}"'
+        cache_headers = {
+            'ETag': etag,
+            'Cache-Control': f'private, max-age={PROFILE_MAX_AGE}'
+        }
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+        
+        response.headers.update(cache_headers)
+        return _user_response(profile)
+        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error obteniendo perfil: {str(e)}")
         raise HTTPException(
@@ -115,13 +164,22 @@ async def get_profile(credentials: HTTPAuthorizationCredentials = Depends(securi
             detail="Token inválido o expirado"
         )
 
-# Funciones auxiliares para JWT (implementar en un módulo separado)
+# Funciones auxiliares para JWT
 def create_access_token(email: str) -> str:
     """Crea un token JWT de acceso"""
-    # Implementar generación de JWT
-    pass
+    payload = {
+        "sub": email,
+        "exp": datetime.utcnow() + _JWT_EXPIRE
+    }
+    return jwt.encode(payload, _JWT_SECRET, algorithm=_JWT_ALGORITHM)
 
 def verify_access_token(token: str) -> str:
     """Verifica un token JWT y retorna el email del usuario"""
-    # Implementar verificación de JWT
-    pass
\ No newline at end of file
+    try:
+        payload = jwt.decode(token, _JWT_SECRET, algorithms=[_JWT_ALGORITHM])
+        return payload["sub"]
+    except (jwt.InvalidTokenError, KeyError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token inválido o expirado"
+        )
@@ -16,19 +16,59 @@ Fecha: Noviembre 2024
 """
 
 from datetime import datetime, timedelta
+import asyncio
 import logging
-from typing import Optional, Dict, List
-from uuid import uuid4
+from typing import Optional, Dict, List, Tuple
 from google.oauth2 import id_token
 from google.auth.transport import requests
+import requests_cache
+from async_lru import alru_cache
+from sqlalchemy import select, update
 
 from app.db.models import User, UserActivity, UserRole
-from app.db.database import db_manager
+from app.db.base import db_manager
+from app.db.activity_writer import record_activity
 from app.config import settings
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
+# Tiempo máximo (segundos) que se reutilizan los certificados públicos de Google
+# si la respuesta no trae Cache-Control
+GOOGLE_CERTS_TTL = 3600
+
+# Caché del rol de usuarios activos usada por check_authorization
+ROLE_CACHE_SIZE = 10_000
+ROLE_CACHE_TTL = 30  # Segundos; un cambio de rol tarda como máximo esto en aplicarse
+
+class _UsuarioNoAutorizado(Exception):
+    """Usuario inexistente o inactivo (el resultado no se cachea)"""
+
+@alru_cache(maxsize=ROLE_CACHE_SIZE, ttl=ROLE_CACHE_TTL)
+async def _rol_activo_cached(email: str) -> UserRole:
+    """
+    Rol de un usuario activo, memoizado por email.
+    
+    Si el usuario no existe o está inactivo se lanza `_UsuarioNoAutorizado`,
+    para que un usuario recién creado no quede rechazado hasta que expire
+    la entrada.
+    """
+    role = await asyncio.to_thread(_load_active_role, email)
+    if role is None:
+        raise _UsuarioNoAutorizado(email)
+    return role
+
+def _load_active_role(email: str) -> Optional[UserRole]:
+    """Consulta síncrona del rol de un usuario activo (se ejecuta en un hilo)"""
+    with db_manager.get_db() as db:
+        # Solo la columna del rol: sin instanciar el modelo completo
+        return db.execute(
+            select(User.role).where(
+                User.email == email,
+                User.is_active.is_(True)
+            )
+        ).scalar_one_or_none()
+
 class UserService:
     """
     Servicio principal para la gestión de usuarios.
@@ -37,6 +77,19 @@ class UserService:
     
     def __init__(self):
         self.google_client_id = settings.GOOGLE_CLIENT_ID
+        # Emails con rol especial, normalizados una sola vez a minúsculas
+        self._admin_emails = frozenset(e.lower() for e in settings.ADMIN_EMAILS_LIST)
+        self._validator_emails = frozenset(e.lower() for e in settings.VALIDATOR_EMAILS_LIST)
+        # Transporte reutilizable: mantiene la conexión TLS con Google y
+        # cachea en memoria los certificados respetando su Cache-Control
+        self._google_request = requests.Request(
+            session=requests_cache.CachedSession(
+                'google_certs',
+                backend='memory',
+                cache_control=True,
+                expire_after=GOOGLE_CERTS_TTL
+            )
+        )
     
     async def verify_google_token(self, token: str) -> Dict:
         """
@@ -52,9 +105,11 @@ class UserService:
             ValueError: Si el token es inválido
         """
         try:
-            idinfo = id_token.verify_oauth2_token(
+            # Verificación síncrona (HTTPS + RSA): fuera del event loop
+            idinfo = await asyncio.to_thread(
+                id_token.verify_oauth2_token,
                 token,
-                requests.Request(),
+                self._google_request,
                 self.google_client_id
             )
             
@@ -67,7 +122,7 @@ class UserService:
             logger.error(f"Error verificando token de Google: {str(e)}")
             raise ValueError("Token inválido o expirado")
 
-    async def get_or_create_user(self, google_info: Dict) -> User:
+    async def get_or_create_user(self, google_info: Dict) -> Dict:
         """
         Obtiene un usuario existente o crea uno nuevo basado en la info de Google.
         
@@ -75,42 +130,53 @@ class UserService:
             google_info: Información del usuario de Google
             
         Returns:
-            User: Instancia del usuario
+            Dict: Datos del usuario (ver `User.to_dict`); no se retorna la
+            instancia ORM porque su sesión ya está cerrada
         """
         try:
-            with db_manager.get_db() as db:
-                # Verificar si el usuario existe
-                user = db.query(User).filter(User.email == google_info['email']).first()
-                
-                if user:
-                    # Actualizar información si es necesario
-                    self._update_user_info(user, google_info)
-                    db.commit()
-                    return user
-                
-                # Determinar rol inicial
-                initial_role = self._determine_initial_role(google_info['email'])
-                
-                # Crear nuevo usuario
-                user = User.from_google_info(google_info, role=initial_role)
-                db.add(user)
-                
-                # Registrar actividad
+            user, initial_role = await asyncio.to_thread(self._upsert_user, google_info)
+            
+            if initial_role is not None:
+                # Registrar actividad (una vez creado el usuario, desde el loop)
                 self._register_activity(
-                    db,
-                    user.email,
+                    user['email'],
                     'user_created',
                     {'initial_role': initial_role.value}
                 )
+                logger.info(f"Nuevo usuario creado: {user['email']}")
                 
-                db.commit()
-                logger.info(f"Nuevo usuario creado: {user.email}")
-                return user
+            return user
                 
         except Exception as e:
             logger.error(f"Error en get_or_create_user: {str(e)}")
             raise
 
+    def _upsert_user(self, google_info: Dict) -> Tuple[Dict, Optional[UserRole]]:
+        """
+        Versión síncrona de get_or_create_user (se ejecuta en un hilo).
+        
+        Returns:
+            Tupla (datos del usuario, rol inicial si fue creado o None)
+        """
+        with db_manager.get_db() as db:
+            # Verificar si el usuario existe
+            user = db.query(User).filter(User.email == google_info['email']).first()
+            
+            if user:
+                # Actualizar información si es necesario
+                self._update_user_info(user, google_info)
+                db.commit()
+                return user.to_dict(), None
+            
+            # Determinar rol inicial
+            initial_role = self._determine_initial_role(google_info['email'])
+            
+            # Crear nuevo usuario
+            user = User.from_google_info(google_info, role=initial_role)
+            db.add(user)
+            db.commit()
+            return user.to_dict(), initial_role
+
     def _determine_initial_role(self, email: str) -> UserRole:
         """
         Determina el rol inicial de un usuario basado en su email.
@@ -121,9 +187,10 @@ class UserService:
         Returns:
             UserRole: Rol asignado
         """
-        if email in settings.ADMIN_EMAILS_LIST:
+        email = email.lower()
+        if email in self._admin_emails:
             return UserRole.ADMIN
-        if email in settings.VALIDATOR_EMAILS_LIST:
+        if email in self._validator_emails:
             return UserRole.VALIDATOR
         return UserRole.USER
 
@@ -140,28 +207,26 @@ class UserService:
         user.family_name = google_info.get('family_name', user.family_name)
         user.full_name = google_info.get('name', user.full_name)
         user.locale = google_info.get('locale', user.locale)
-        user.metadata.update({
+        # Se reasigna el dict para que SQLAlchemy detecte el cambio en la columna JSON
+        user.extra_metadata = {
+            **(user.extra_metadata or {}),
             'last_google_update': datetime.utcnow().isoformat(),
             'google_verified_email': google_info.get('email_verified', False)
-        })
+        }
 
-    def _register_activity(self, db, user_email: str, activity_type: str, details: Dict = None):
+    def _register_activity(self, user_email: str, activity_type: str, details: Dict = None):
         """
         Registra una actividad de usuario.
         
+        La actividad se encola y se inserta en lote en segundo plano
+        (ver app.db.activity_writer), fuera de la transacción actual.
+        
         Args:
-            db: Sesión de base de datos
             user_email: Email del usuario
             activity_type: Tipo de actividad
             details: Detalles adicionales
         """
-        activity = UserActivity(
-            id=str(uuid4()),
-            user_email=user_email,
-            activity_type=activity_type,
-            details=details or {}
-        )
-        db.add(activity)
+        record_activity(user_email, activity_type, details)
 
     async def update_last_login(self, email: str) -> bool:
         """
@@ -174,27 +239,34 @@ class UserService:
             bool: True si se actualizó correctamente
         """
         try:
-            with db_manager.get_db() as db:
-                user = db.query(User).filter(User.email == email).first()
-                if user:
-                    user.last_login = datetime.utcnow()
-                    user.last_seen = datetime.utcnow()
-                    
-                    self._register_activity(
-                        db,
-                        email,
-                        'user_login',
-                        {'login_time': datetime.utcnow().isoformat()}
-                    )
-                    
-                    db.commit()
-                    return True
+            now = datetime.utcnow()
+            if not await asyncio.to_thread(self._touch_last_login, email, now):
                 return False
+                    
+            self._register_activity(
+                email,
+                'user_login',
+                {'login_time': now.isoformat()}
+            )
+            return True
                 
         except Exception as e:
             logger.error(f"Error actualizando último login: {str(e)}")
             return False
 
+    def _touch_last_login(self, email: str, now: datetime) -> bool:
+        """Versión síncrona del UPDATE de último login (se ejecuta en un hilo)"""
+        with db_manager.get_db() as db:
+            # UPDATE directo: sin SELECT previo ni instanciar el modelo
+            result = db.execute(
+                update(User)
+                .where(User.email == email)
+                .values(last_login=now, last_seen=now)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return result.rowcount > 0
+
     async def check_authorization(self, email: str, required_role: UserRole) -> bool:
         """
         Verifica si un usuario tiene el rol requerido.
@@ -207,25 +279,20 @@ class UserService:
             bool: True si está autorizado
         """
         try:
-            with db_manager.get_db() as db:
-                user = db.query(User).filter(
-                    User.email == email,
-                    User.is_active == True
-                ).first()
-                
-                if not user:
-                    return False
+            role = await _rol_activo_cached(email)
+            
+            # Admin tiene todos los permisos
+            if role == UserRole.ADMIN:
+                return True
                 
-                # Admin tiene todos los permisos
-                if user.role == UserRole.ADMIN:
-                    return True
-                    
-                # Validator puede hacer todo excepto acciones de admin
-                if user.role == UserRole.VALIDATOR and required_role != UserRole.ADMIN:
-                    return True
-                    
-                return user.role == required_role
+            # Validator puede hacer todo excepto acciones de admin
+            if role == UserRole.VALIDATOR and required_role != UserRole.ADMIN:
+                return True
                 
+            return role == required_role
+            
+        except _UsuarioNoAutorizado:
+            return False
         except Exception as e:
             logger.error(f"Error verificando autorización: {str(e)}")
             return False
@@ -248,21 +315,40 @@ class UserService:
             List[Dict]: Lista de actividades
         """
         try:
-            with db_manager.get_db() as db:
-                query = db.query(UserActivity)\
-                    .filter(UserActivity.user_email == email)\
-                    .order_by(UserActivity.timestamp.desc())
-                
-                if activity_type:
-                    query = query.filter(UserActivity.activity_type == activity_type)
-                
-                activities = query.limit(limit).all()
-                return [activity.to_dict() for activity in activities]
+            return await asyncio.to_thread(self._load_activities, email, limit, activity_type)
                 
         except Exception as e:
             logger.error(f"Error obteniendo actividades: {str(e)}")
             return []
 
+    def _load_activities(self, email: str, limit: int, activity_type: str = None) -> List[Dict]:
+        """Versión síncrona de get_user_activities (se ejecuta en un hilo)"""
+        with db_manager.get_db() as db:
+            return self._query_activities(db, email, limit, activity_type)
+
+    def _query_activities(self, db, email: str, limit: int, activity_type: str = None) -> List[Dict]:
+        """
+        Consulta las últimas actividades de un usuario con una sesión existente.
+        
+        Args:
+            db: Sesión de base de datos
+            email: Email del usuario
+            limit: Límite de registros a retornar
+            activity_type: Filtro por tipo de actividad
+            
+        Returns:
+            List[Dict]: Lista de actividades, de la más reciente a la más antigua
+        """
+        query = db.query(UserActivity)\
+            .filter(UserActivity.user_email == email)\
+            .order_by(UserActivity.ts_ms.desc())
+        
+        if activity_type:
+            query = query.filter(UserActivity.activity_type == activity_type)
+        
+        activities = query.limit(limit).all()
+        return [activity.to_dict() for activity in activities]
+
     async def get_user_profile(self, email: str) -> Optional[Dict]:
         """
         Obtiene el perfil completo de un usuario.
@@ -274,26 +360,31 @@ class UserService:
             Dict: Información completa del usuario o None si no existe
         """
         try:
-            with db_manager.get_db() as db:
-                user = db.query(User).filter(User.email == email).first()
-                if not user:
-                    return None
-                    
-                # Obtener últimas actividades
-                recent_activities = await self.get_user_activities(email, limit=5)
-                
-                # Construir perfil completo
-                profile = user.to_dict()
-                profile.update({
-                    'recent_activities': recent_activities,
-                    'permissions': UserRole.get_permissions(user.role)
-                })
-                
-                return profile
+            return await asyncio.to_thread(self._load_profile, email)
                 
         except Exception as e:
             logger.error(f"Error obteniendo perfil: {str(e)}")
             return None
 
+    def _load_profile(self, email: str) -> Optional[Dict]:
+        """Versión síncrona de get_user_profile (se ejecuta en un hilo)"""
+        with db_manager.get_db() as db:
+            user = db.query(User).filter(User.email == email).first()
+            if not user:
+                return None
+                
+            # Obtener últimas actividades en la misma sesión (sin abrir
+            # otra conexión/transacción)
+            recent_activities = self._query_activities(db, email, limit=5)
+            
+            # Construir perfil completo
+            profile = user.to_dict()
+            profile.update({
+                'recent_activities': recent_activities,
+                'permissions': UserRole.get_permissions(user.role)
+            })
+            
+            return profile
+
 # Instancia global del servicio
 user_service = UserService()
\ No newline at end of file
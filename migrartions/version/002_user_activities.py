@@ -0,0 +1,35 @@
+"""
+Tabla de actividades de usuarios e índices para "últimas actividades de un usuario"
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002_user_activities'
+down_revision = '001_initial'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 001 no creaba la tabla; puede existir si se creó fuera de las migraciones
+    if not sa.inspect(op.get_bind()).has_table('user_activities'):
+        op.create_table(
+            'user_activities',
+            sa.Column('id', sa.String(), primary_key=True),
+            sa.Column('user_email', sa.String(), sa.ForeignKey('users.email')),
+            sa.Column('activity_type', sa.String()),
+            sa.Column('timestamp', sa.DateTime(), server_default=sa.func.now()),
+            sa.Column('details', sa.JSON())
+        )
+
+    # Índices compuestos para "últimas actividades de un usuario"
+    # (WHERE user_email = ? [AND activity_type = ?] ORDER BY timestamp DESC LIMIT n)
+    op.create_index('ix_activities_user_ts', 'user_activities',
+                    ['user_email', sa.text('timestamp DESC')])
+    op.create_index('ix_activities_user_type_ts', 'user_activities',
+                    ['user_email', 'activity_type', sa.text('timestamp DESC')])
+
+def downgrade():
+    op.drop_index('ix_activities_user_type_ts', table_name='user_activities')
+    op.drop_index('ix_activities_user_ts', table_name='user_activities')
+    op.drop_table('user_activities')
@@ -0,0 +1,59 @@
+"""
+Guarda el momento de las actividades como epoch UTC en milisegundos (BIGINT)
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003_activity_ts_ms'
+down_revision = '002_user_activities'
+branch_labels = None
+depends_on = None
+
+def _epoch_ms(column: str) -> str:
+    """Expresión SQL que convierte una columna DateTime a epoch en milisegundos"""
+    if op.get_bind().dialect.name == 'sqlite':
+        return f"CAST((julianday({column}) - 2440587.5) * 86400000 AS INTEGER)"
+    return f"CAST(EXTRACT(EPOCH FROM {column}) * 1000 AS BIGINT)"
+
+def _datetime(column: str) -> str:
+    """Expresión SQL que convierte epoch en milisegundos a DateTime"""
+    if op.get_bind().dialect.name == 'sqlite':
+        return f"datetime({column} / 1000.0, 'unixepoch')"
+    return f"to_timestamp({column} / 1000.0) AT TIME ZONE 'UTC'"
+
+def upgrade():
+    # Nueva columna y copia de los valores existentes
+    op.add_column('user_activities', sa.Column('ts_ms', sa.BigInteger()))
+    op.execute(f"UPDATE user_activities SET ts_ms = {_epoch_ms('timestamp')}")
+
+    # Índices sobre la nueva columna
+    op.drop_index('ix_activities_user_type_ts', table_name='user_activities')
+    op.drop_index('ix_activities_user_ts', table_name='user_activities')
+
+    with op.batch_alter_table('user_activities') as batch_op:
+        batch_op.alter_column('ts_ms', existing_type=sa.BigInteger(), nullable=False)
+        batch_op.drop_column('timestamp')
+
+    op.create_index('ix_activities_user_ts', 'user_activities',
+                    ['user_email', sa.text('ts_ms DESC')])
+    op.create_index('ix_activities_user_type_ts', 'user_activities',
+                    ['user_email', 'activity_type', sa.text('ts_ms DESC')])
+
+def downgrade():
+    # SQLite no admite ADD COLUMN con un default no constante: el default
+    # se agrega después, dentro del batch (que recrea la tabla)
+    op.add_column('user_activities', sa.Column('timestamp', sa.DateTime()))
+    op.execute(f"UPDATE user_activities SET timestamp = {_datetime('ts_ms')}")
+
+    op.drop_index('ix_activities_user_type_ts', table_name='user_activities')
+    op.drop_index('ix_activities_user_ts', table_name='user_activities')
+
+    with op.batch_alter_table('user_activities') as batch_op:
+        batch_op.alter_column('timestamp', existing_type=sa.DateTime(), server_default=sa.func.now())
+        batch_op.drop_column('ts_ms')
+
+    op.create_index('ix_activities_user_ts', 'user_activities',
+                    ['user_email', sa.text('timestamp DESC')])
+    op.create_index('ix_activities_user_type_ts', 'user_activities',
+                    ['user_email', 'activity_type', sa.text('timestamp DESC')])
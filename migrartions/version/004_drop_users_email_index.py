@@ -0,0 +1,16 @@
+"""
+Elimina el índice redundante sobre users.email (la clave primaria ya tiene su propio índice)
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '004_drop_users_email_index'
+down_revision = '003_activity_ts_ms'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.drop_index('ix_users_email', table_name='users')
+
+def downgrade():
+    op.create_index('ix_users_email', 'users', ['email'])
@@ -0,0 +1,17 @@
+"""
+Configuración común de las pruebas
+
+Define las variables de entorno mínimas antes de importar la aplicación
+(la configuración y la base de datos se inicializan al importar) y usa una
+base SQLite temporal.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("GOOGLE_CLIENT_ID", "test-client-id")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "test-client-secret")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-with-at-least-32-bytes")
+os.environ["DB_TYPE"] = "sqlite"
+os.environ["SQLITE_PATH"] = tempfile.mkdtemp(prefix="udcito-test-")
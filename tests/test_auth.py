@@ -0,0 +1,89 @@
+"""
+Pruebas de las rutas de autenticación
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.db.base import db_manager
+from app.db.models import Base, User, UserRole
+from app.routes.auth import create_access_token, router
+
+EMAIL = "ana@udc.edu.ar"
+
+@pytest.fixture(scope="module")
+def client():
+    Base.metadata.create_all(db_manager.get_engine())
+    with db_manager.get_db() as db:
+        db.merge(User(email=EMAIL, full_name="Ana Pérez", role=UserRole.USER))
+        db.commit()
+
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+def _auth(email: str = EMAIL) -> dict:
+    return {"Authorization": f"Bearer {create_access_token(email)}"}
+
+def test_profile_returns_etag_and_304_when_unchanged(client):
+    response = client.get("/auth/profile", headers=_auth())
+
+    assert response.status_code == 200
+    assert response.json()["name"] == "Ana Pérez"
+    etag = response.headers["etag"]
+
+    response = client.get("/auth/profile", headers={**_auth(), "If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+def test_profile_unknown_user_is_404(client):
+    response = client.get("/auth/profile", headers=_auth("nadie@udc.edu.ar"))
+
+    assert response.status_code == 404
+
+def test_profile_invalid_token_is_401(client):
+    response = client.get("/auth/profile", headers={"Authorization": "Bearer invalido"})
+
+    assert response.status_code == 401
+
+def _google_info(email: str) -> dict:
+    return {
+        "iss": "accounts.google.com",
+        "sub": f"google-{email}",
+        "email": email,
+        "email_verified": True,
+        "name": "Carla Díaz",
+        "given_name": "Carla",
+        "family_name": "Díaz",
+    }
+
+def test_google_login_new_and_existing_user(client, monkeypatch):
+    from app.services.user_services import user_service
+
+    async def _verify(token):
+        return _google_info(token)
+
+    monkeypatch.setattr(user_service, "verify_google_token", _verify)
+    email = "carla@udc.edu.ar"
+
+    # Primer login: crea el usuario
+    response = client.post("/auth/login/google", json={"token": email})
+
+    assert response.status_code == 200
+    assert response.json()["user"]["email"] == email
+    assert response.json()["user"]["name"] == "Carla Díaz"
+
+    # Segundo login: el usuario ya existe
+    response = client.post("/auth/login/google", json={"token": email})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["user"]["email"] == email
+    assert body["user"]["role"] == UserRole.USER.value
+    assert client.get(
+        "/auth/profile",
+        headers={"Authorization": f"Bearer {body['access_token']}"}
+    ).status_code == 200
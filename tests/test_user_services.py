@@ -0,0 +1,50 @@
+"""
+Pruebas del servicio de usuarios
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import event
+
+from app.db.activity_writer import activity_writer
+from app.db.base import db_manager
+from app.db.models import Base, User, UserRole
+from app.services.user_services import user_service
+
+EMAIL = "beto@udc.edu.ar"
+
+@pytest.fixture(scope="module", autouse=True)
+def usuario():
+    Base.metadata.create_all(db_manager.get_engine())
+    with db_manager.get_db() as db:
+        db.merge(User(email=EMAIL, full_name="Beto Gómez", role=UserRole.USER))
+        db.commit()
+    for i in range(3):
+        activity_writer.record_activity(EMAIL, "test", {"n": i})
+
+@pytest.fixture
+def sentencias():
+    """Registra los SELECT ejecutados contra la base"""
+    ejecutadas = []
+
+    def _registrar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            ejecutadas.append(statement)
+
+    engine = db_manager.get_engine()
+    event.listen(engine, "before_cursor_execute", _registrar)
+    yield ejecutadas
+    event.remove(engine, "before_cursor_execute", _registrar)
+
+def test_get_user_activities_is_a_single_select(sentencias):
+    actividades = asyncio.run(user_service.get_user_activities(EMAIL))
+
+    assert len(actividades) == 3
+    assert len(sentencias) == 1
+
+def test_get_user_profile_uses_two_selects(sentencias):
+    perfil = asyncio.run(user_service.get_user_profile(EMAIL))
+
+    assert len(perfil["recent_activities"]) == 3
+    assert len(sentencias) == 2